@@ -0,0 +1,7 @@
+"""Shared pytest configuration for the invoice processor tests."""
+
+import os
+
+# improved_invoice_processor checks for the key at import time, before any fixture runs;
+# the tests never reach the real API
+os.environ.setdefault("OPENAI_API_KEY", "dummy")
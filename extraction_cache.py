@@ -0,0 +1,272 @@
+"""
+Extraction Cache for Invoice Processor
+
+This module provides content-addressable on-disk caches of invoice details
+extracted by OpenAI and of text extracted from PDFs, so re-running the processor
+on PDFs it has already seen (re-runs, dry-runs followed by a real run, ...)
+doesn't query the API or parse the PDF again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Optional faster hashing for PDF contents
+try:
+    import blake3
+    USE_BLAKE3 = True
+except ImportError:
+    USE_BLAKE3 = False
+
+# Configure logging
+logger = logging.getLogger("invoice_processor")
+
+# Default directory for cached extraction results
+DEFAULT_CACHE_DIR = Path(".invoice_cache")
+
+# Default directory for cached PDF text
+DEFAULT_TEXT_CACHE_DIR = Path(".pdf_text_cache")
+
+# Bump when the prompt or the cached result format changes to invalidate old entries
+CACHE_VERSION = "v2"
+
+# Bump when text extraction changes to invalidate old PDF text entries
+TEXT_CACHE_VERSION = "v1"
+
+
+def cache_key(pdf_bytes: bytes, openai_model: str) -> str:
+    """
+    Build the cache key for a PDF's extraction result.
+
+    The PDF content is length-prefixed before hashing so the key stays
+    unambiguous if more inputs are ever hashed alongside it.
+
+    Args:
+        pdf_bytes: Raw bytes of the PDF file
+        openai_model: The OpenAI model used for extraction
+
+    Returns:
+        str: Key of the form '<sha256>:<model>:<version>'
+    """
+    hasher = hashlib.sha256()
+    hasher.update(len(pdf_bytes).to_bytes(8, "little"))
+    hasher.update(pdf_bytes)
+    return f"{hasher.hexdigest()}:{openai_model}:{CACHE_VERSION}"
+
+
+def content_digest(data: bytes) -> str:
+    """
+    Hash file contents, using BLAKE3 when available and SHA-256 otherwise.
+
+    Args:
+        data: Bytes to hash
+
+    Returns:
+        str: Hex digest of the data
+    """
+    if USE_BLAKE3:
+        return blake3.blake3(data).hexdigest()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomically(path: Path, text: str) -> None:
+    """Write text to path through a temporary file in the same directory."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file_path = None
+    try:
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, dir=path.parent,
+                                         suffix=".tmp", encoding='utf-8') as temp_f:
+            temp_file_path = Path(temp_f.name)
+            temp_f.write(text)
+        os.replace(temp_file_path, path)
+    except BaseException:
+        if temp_file_path and temp_file_path.exists():
+            try:
+                os.remove(temp_file_path)
+            except OSError:
+                pass
+        raise
+
+
+class ExtractionCache:
+    """A class to store and look up extracted invoice details on disk."""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        """
+        Initialize the ExtractionCache.
+
+        Args:
+            cache_dir: Directory where cache entries are stored.
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, key: str) -> Path:
+        """Return the file holding the entry for a key (sharded by hash prefix)."""
+        # Model names may contain characters that aren't valid in file names
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / name[:2] / f"{name}.json"
+
+    def get(self, key: str) -> Optional[Tuple[str, str, float]]:
+        """
+        Look up cached invoice details.
+
+        Args:
+            key: Cache key from cache_key()
+
+        Returns:
+            Tuple of (provider, date_str, usd_amount) if cached, None otherwise
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry.get("key") != key:
+                raise ValueError("key mismatch")
+            details = (entry["provider"], entry["date"], float(entry["usd_amount"]))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {entry_path}: {str(e)}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.debug(f"Extraction cache hit for {key}")
+        return details
+
+    def set(self, key: str, provider: str, date_str: str, usd_amount: float) -> None:
+        """
+        Store invoice details, replacing any existing entry atomically.
+
+        Args:
+            key: Cache key from cache_key()
+            provider: Invoice provider
+            date_str: Invoice date in dd_MM_yyyy format
+            usd_amount: Amount in USD
+        """
+        entry_path = self._entry_path(key)
+        entry = {"key": key, "provider": provider, "date": date_str, "usd_amount": usd_amount}
+
+        try:
+            _write_atomically(entry_path, json.dumps(entry))
+            logger.debug(f"Cached extraction result for {key}")
+        except (IOError, OSError) as e:
+            # The cache is an optimization only; never fail processing because of it
+            logger.warning(f"Could not write cache entry {entry_path}: {str(e)}")
+
+
+class PdfTextCache:
+    """A class to store and look up text extracted from PDFs on disk."""
+
+    def __init__(self, cache_dir: Path = DEFAULT_TEXT_CACHE_DIR, max_bytes: Optional[int] = None):
+        """
+        Initialize the PdfTextCache.
+
+        Args:
+            cache_dir: Directory where cached texts are stored.
+            max_bytes: Evict least recently used texts once the cache grows past
+                this size (None for no limit).
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Total size of the cached texts, measured on the first eviction check
+        self._size: Optional[int] = None
+
+    def _entry_path(self, pdf_bytes: bytes) -> Path:
+        """Return the file holding the text of a PDF (sharded by hash prefix)."""
+        digest = content_digest(TEXT_CACHE_VERSION.encode("ascii") + pdf_bytes)
+        return self.cache_dir / digest[:2] / f"{digest}.txt"
+
+    def get(self, pdf_bytes: bytes) -> Optional[str]:
+        """
+        Look up the cached text of a PDF.
+
+        Args:
+            pdf_bytes: Raw bytes of the PDF file
+
+        Returns:
+            The extracted text if cached, None otherwise
+        """
+        entry_path = self._entry_path(pdf_bytes)
+        try:
+            text = entry_path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {entry_path}: {str(e)}")
+            self.misses += 1
+            return None
+
+        if self.max_bytes is not None:
+            try:
+                # Mark the entry as recently used for eviction
+                os.utime(entry_path)
+            except OSError:
+                pass
+        self.hits += 1
+        logger.debug(f"PDF text cache hit for {entry_path.name}")
+        return text
+
+    def set(self, pdf_bytes: bytes, text: str) -> None:
+        """
+        Store the text of a PDF, evicting old entries if the cache is over its size limit.
+
+        Args:
+            pdf_bytes: Raw bytes of the PDF file
+            text: Text extracted from the PDF
+        """
+        entry_path = self._entry_path(pdf_bytes)
+        old_size = 0
+        if self.max_bytes is not None and self._size is not None:
+            try:
+                # An overwritten entry replaces its old size instead of adding to it
+                old_size = entry_path.stat().st_size
+            except OSError:
+                pass
+        try:
+            _write_atomically(entry_path, text)
+            logger.debug(f"Cached PDF text in {entry_path.name}")
+        except (IOError, OSError) as e:
+            # The cache is an optimization only; never fail processing because of it
+            logger.warning(f"Could not write cache entry {entry_path}: {str(e)}")
+            return
+
+        if self.max_bytes is not None:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self.cache_dir.glob("*/*.txt"))
+            else:
+                self._size += entry_path.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used texts until the cache fits in max_bytes."""
+        entries = []
+        for entry in self.cache_dir.glob("*/*.txt"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort(key=lambda item: item[0])
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+                self._size -= size
+                logger.debug(f"Evicted cached PDF text {entry.name}")
+            except OSError as e:
+                logger.warning(f"Could not evict cache entry {entry}: {str(e)}")
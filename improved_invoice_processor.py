@@ -7,20 +7,84 @@ OpenAI's GPT-4 model, converts USD amounts to BRL, and saves the renamed files
 to an output folder with a standardized naming convention.
 """
 
+import io
 import os
+import re
 import sys
+import array
+import time
+import shutil
+import random
+import atexit
+import asyncio
+import argparse
 import logging
+import logging.handlers
+import tempfile
+import functools
+import hashlib
+import importlib.util
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import PyPDF2  # type: ignore # Using type_ignore as stubs aren't available
-from typing import Dict, List, Optional, Tuple, Union, cast
+from typing import Any, Dict, List, Optional, Tuple, Union, cast
 from datetime import datetime
 from pathlib import Path
 from forex_python.converter import CurrencyRates  # type: ignore
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 from dotenv import load_dotenv  # type: ignore
-from tqdm import tqdm  # type: ignore
+from tqdm.asyncio import tqdm as async_tqdm  # type: ignore
 import csv
 import json as json_module
 
+# PyMuPDF's C extractor is much faster than PyPDF2; use it when it is installed
+try:
+    import fitz  # type: ignore
+    USE_PYMUPDF = True
+except ImportError:
+    USE_PYMUPDF = False
+
+# pypdfium2 binds Google's C++ PDFium; the fast extractor used when PyMuPDF isn't installed
+try:
+    import pypdfium2 as pdfium  # type: ignore
+    USE_PYPDFIUM2 = True
+except ImportError:
+    USE_PYPDFIUM2 = False
+
+# orjson serializes much faster than the json module; use it when it is installed
+try:
+    import orjson  # type: ignore
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+# tiktoken counts tokens exactly; without it, text length is estimated from characters
+try:
+    import tiktoken  # type: ignore
+    USE_TIKTOKEN = True
+except ImportError:
+    USE_TIKTOKEN = False
+
+# fcntl (POSIX only) is needed for copy-on-write clones of invoices
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+# HTTP/2 multiplexes concurrent requests over one connection; httpx needs h2 for it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Errors raised for invalid or corrupted PDF files
+PDF_READ_ERRORS: Tuple[type, ...] = (PyPDF2.errors.PdfReadError,)
+if USE_PYMUPDF:
+    PDF_READ_ERRORS += (fitz.FileDataError,)
+if USE_PYPDFIUM2:
+    PDF_READ_ERRORS += (pdfium.PdfiumError,)
+
 # Import provider mapping functionality
 try:
     from provider_mapping import ProviderMapper
@@ -29,13 +93,33 @@ except ImportError:
     USE_PROVIDER_MAPPING = False
     print("Provider mapping module not found. Will always use OpenAI for provider identification.")
 
+# Worker function for the PDF extraction process pool
+from pdf_worker import extract_page_range
+
+# Import extraction cache functionality
+try:
+    from extraction_cache import DEFAULT_CACHE_DIR, ExtractionCache, cache_key
+    USE_EXTRACTION_CACHE = True
+except ImportError:
+    USE_EXTRACTION_CACHE = False
+    print("Extraction cache module not found. Every run will query OpenAI.")
+
 # Configure logging
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Records buffered before the log file is written; errors are written right away
+LOG_BUFFER_CAPACITY = 1000
+
+# The log file is written in batches instead of once per record; logging's exit
+# hook flushes what is left in the buffer
+_log_file_handler = logging.FileHandler("invoice_processor.log")
+_log_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
         logging.StreamHandler(),
-        logging.FileHandler("invoice_processor.log")
+        logging.handlers.MemoryHandler(LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR,
+                                       target=_log_file_handler)
     ]
 )
 logger = logging.getLogger("invoice_processor")
@@ -43,10 +127,23 @@ logger = logging.getLogger("invoice_processor")
 # Load environment variables
 load_dotenv()
 
+def _load_api_key() -> str:
+    """
+    Read the OpenAI API key from the environment.
+    
+    Returns:
+        str: The API key
+        
+    Raises:
+        ValueError: If OPENAI_API_KEY is not set
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+    return api_key
+
 # Get API key from environment
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
+OPENAI_API_KEY = _load_api_key()
 
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
@@ -60,43 +157,163 @@ DEFAULT_OUTPUT_FOLDER = Path("processed_invoices")
 OPENAI_MODEL_DEFAULT = "o4-mini"
 USE_LIVE_EXCHANGE_RATES_DEFAULT = False
 FALLBACK_EXCHANGE_RATE_DEFAULT = 5.74
+OPENAI_CONCURRENCY_DEFAULT = 8
+WORKERS_DEFAULT = 8  # threads for blocking work (PDF parsing, file copies)
+OPENAI_MAX_ATTEMPTS = 3
+INVOICE_TEXT_MAX_TOKENS = 2000  # longer invoice text is cut down to its head and tail
+INVOICE_TEXT_HEAD_TOKENS = 1500
+CHARS_PER_TOKEN_ESTIMATE = 4  # used when tiktoken isn't installed
+# Reasoning models (the default o4-mini) spend completion tokens on hidden reasoning
+# before the short answer, so this budget must stay well above the answer's length
+MAX_COMPLETION_TOKENS_DEFAULT = 10000
+RETRY_BASE_DELAY = 2  # seconds, doubled on every attempt
+RETRY_MAX_DELAY = 20  # seconds
+BATCH_POLL_INTERVAL_DEFAULT = 30  # seconds
+COPY_MODE_DEFAULT = "auto"  # how invoices are placed in the output folder (see _copy_invoice)
+COPY_MODES = ("auto", "link", "reflink", "copy")
+FICLONE = 0x40049409  # Linux ioctl cloning a whole file (linux/fs.h)
+PDF_PARALLEL_MIN_PAGES_DEFAULT = 8  # smaller PDFs aren't worth the inter-process overhead
+LIVE_RATE_TTL_SECONDS = 3600  # how long a fetched live exchange rate is reused
 # --------------------------------
 
-# Initialize provider mapper if available
-if USE_PROVIDER_MAPPING:
-    provider_mapper = ProviderMapper()
+# Errors worth retrying: rate limits, network problems, OpenAI-side failures and
+# empty answers. Anything else (bad key, bad request, ...) fails immediately.
+RETRYABLE_OPENAI_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    ValueError,
+)
+
+# Batch API states after which a batch will not make further progress
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Completion token budget per extraction request
+MAX_COMPLETION_TOKENS = int(os.getenv("OPENAI_MAX_COMPLETION_TOKENS", MAX_COMPLETION_TOKENS_DEFAULT))
+
+# Initialize provider mapper if available; mappings learned during a run are
+# written once when the process exits instead of after every invoice. PDF worker
+# processes started with spawn or forkserver re-import the main script, and must
+# not save (and so rewrite) the mapping file when they exit.
+if USE_PROVIDER_MAPPING and multiprocessing.parent_process() is None:
+    provider_mapper = ProviderMapper(autosave=False)
+    atexit.register(provider_mapper.save)
     logger.info(f"Initialized provider mapper with {len(provider_mapper.get_all_mappings())} mappings")
 
-def extract_text_from_pdf(pdf_path: Path) -> str:
+# Process pool for extracting text from large PDFs, created on first use
+_PDF_POOL_WORKERS = os.cpu_count() or 1
+_pdf_process_pool: Optional[ProcessPoolExecutor] = None
+_pdf_process_pool_lock = threading.Lock()
+
+
+def _get_pdf_process_pool() -> ProcessPoolExecutor:
+    """Return the shared PDF extraction process pool, creating it if needed."""
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is None:
+            _pdf_process_pool = ProcessPoolExecutor(max_workers=_PDF_POOL_WORKERS)
+        return _pdf_process_pool
+
+
+def _extract_pages_parallel(pdf_bytes: bytes, page_count: int) -> List[str]:
     """
-    Extract text content from a PDF file.
+    Extract page texts using the shared process pool.
+    
+    Pages are split into one contiguous range per worker so each worker parses
+    the PDF only once.
+    
+    Args:
+        pdf_bytes: Raw bytes of the PDF file
+        page_count: Number of pages in the PDF
+        
+    Returns:
+        List of page texts, in page order
+    """
+    pool = _get_pdf_process_pool()
+    chunk_size = -(-page_count // _PDF_POOL_WORKERS)  # ceiling division
+    jobs = [(pdf_bytes, start, min(start + chunk_size, page_count))
+            for start in range(0, page_count, chunk_size)]
+    page_texts: List[str] = []
+    for chunk in pool.map(extract_page_range, jobs):
+        page_texts.extend(chunk)
+    return page_texts
+
+
+def _pdfium_page_texts(pdf_bytes: bytes) -> List[str]:
+    """
+    Extract the text of every page with pypdfium2.
+    
+    Args:
+        pdf_bytes: Raw bytes of the PDF file
+        
+    Returns:
+        List with the text of each page
+    """
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        page_texts = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            page_texts.append(textpage.get_text_range())
+            # Release the native handles now rather than at garbage collection
+            textpage.close()
+            page.close()
+        return page_texts
+    finally:
+        pdf.close()
+
+
+def _read_pdf(pdf_path: Path) -> Tuple[str, int]:
+    """
+    Parse a PDF file once, returning its text and page count.
+    
+    Uses PyMuPDF when available, then pypdfium2. With PyPDF2, PDFs with at least
+    PDF_PARALLEL_MIN_PAGES pages have their pages extracted in parallel in a
+    process pool, since PyPDF2's extractor is CPU-bound.
     
     Args:
         pdf_path: Path to the PDF file
         
     Returns:
-        str: Extracted text content
+        Tuple of (extracted text content, number of pages)
         
     Raises:
         FileNotFoundError: If the PDF file doesn't exist
         PyPDF2.errors.PdfReadError: If the PDF file is invalid or corrupted
+        fitz.FileDataError: If the PDF file is invalid or corrupted (with PyMuPDF)
+        pypdfium2.PdfiumError: If the PDF file is invalid or corrupted (with pypdfium2)
     """
     logger.debug(f"Extracting text from {pdf_path}")
     try:
         with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page_num, page in enumerate(reader.pages):
-                page_text = page.extract_text() or ""
-                text += page_text
+            pdf_bytes = file.read()
+        
+        if USE_PYMUPDF:
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                page_texts = [page.get_text("text") for page in doc]
+        elif USE_PYPDFIUM2:
+            page_texts = _pdfium_page_texts(pdf_bytes)
+        else:
+            reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+            page_count = len(reader.pages)
+            min_parallel_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", PDF_PARALLEL_MIN_PAGES_DEFAULT))
+            if page_count >= min_parallel_pages > 0:
+                logger.debug(f"Extracting {page_count} pages in parallel")
+                page_texts = _extract_pages_parallel(pdf_bytes, page_count)
+            else:
+                page_texts = [page.extract_text() or "" for page in reader.pages]
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            for page_num, page_text in enumerate(page_texts):
                 logger.debug(f"Extracted {len(page_text)} characters from page {page_num+1}")
-            
-            logger.debug(f"Total extracted: {len(text)} characters")
-            return text
+        text = "".join(page_texts)
+        
+        logger.debug(f"Total extracted: {len(text)} characters")
+        return text, len(page_texts)
     except FileNotFoundError:
         logger.error(f"PDF file not found: {pdf_path}")
         raise
-    except PyPDF2.errors.PdfReadError as e:
+    except PDF_READ_ERRORS as e:
         logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
         raise
     except Exception as e:
@@ -104,95 +321,319 @@ def extract_text_from_pdf(pdf_path: Path) -> str:
         raise
 
 
-def get_invoice_details(
-    pdf_text: str, client: OpenAI, openai_model: str, logger: logging.Logger,
-    use_live_rates: bool = False, fallback_rate: float = 5.74
-) -> Tuple[str, str, float, float]:
+def extract_text_from_pdf(pdf_path: Path) -> str:
     """
-    Extract invoice details from PDF text using OpenAI API.
+    Extract text content from a PDF file.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        
+    Returns:
+        str: Extracted text content
+        
+    Raises:
+        FileNotFoundError: If the PDF file doesn't exist
+        PyPDF2.errors.PdfReadError: If the PDF file is invalid or corrupted
+        fitz.FileDataError: If the PDF file is invalid or corrupted (with PyMuPDF)
+        pypdfium2.PdfiumError: If the PDF file is invalid or corrupted (with pypdfium2)
+    """
+    return _read_pdf(pdf_path)[0]
+
+
+def _identify_provider(pdf_text: str, logger: logging.Logger) -> Optional[str]:
+    """
+    Try identifying the invoice provider locally using the provider mapping.
     
     Args:
         pdf_text: The text extracted from the PDF
-        client: The OpenAI client
-        openai_model: The OpenAI model to use
         logger: Logger instance
-        use_live_rates: Whether to use live exchange rates
-        fallback_rate: Fallback exchange rate when live rates are disabled/unavailable
         
     Returns:
-        Tuple containing (provider, date_str, usd_amount, brl_amount)
+        The canonical provider name if found, None otherwise
     """
-    # First try identifying the provider using our mapping
-    provider_from_mapping = None
-    if USE_PROVIDER_MAPPING:
-        provider_from_mapping = provider_mapper.identify_provider(pdf_text)
-        if provider_from_mapping:
-            logger.info(f"Provider identified from mapping: {provider_from_mapping}")
+    if not USE_PROVIDER_MAPPING:
+        return None
     
-    # If we have a provider from mapping, construct the prompt to extract only date and amount
+    provider_from_mapping = provider_mapper.identify_provider(pdf_text)
     if provider_from_mapping:
-        prompt = (
-            f"I already know the service provider is '{provider_from_mapping}'.\n"
-            "Extract ONLY the following details from the invoice text and return them in a strict format of 3 elements separated by ' - ':\n"
-            "1. Date in dd_MM_yyyy format\n"
-            "2. Amount in USD (just the number)\n"
-            "3. 'USD'\n\n"
-            f"Text from invoice:\n{pdf_text}\n\n"
-            "Important: Respond ONLY with the 3 elements separated by ' - ' without any additional text."
-        )
+        logger.info(f"Provider identified from mapping: {provider_from_mapping}")
+    return provider_from_mapping
+
+
+@functools.lru_cache(maxsize=None)
+def _get_token_encoding(openai_model: str) -> "tiktoken.Encoding":
+    """Return the tiktoken encoding for a model (o200k_base for unknown models)."""
+    try:
+        return tiktoken.encoding_for_model(openai_model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _truncate_invoice_text(pdf_text: str, openai_model: str) -> str:
+    """
+    Cut invoice text down to INVOICE_TEXT_MAX_TOKENS tokens.
+    
+    The head and the tail are kept, since the issuer and date are usually at
+    the top and the total at the bottom of an invoice.
+    
+    Args:
+        pdf_text: The text extracted from the PDF
+        openai_model: The OpenAI model the text is sent to
+        
+    Returns:
+        str: The text, truncated if it was over budget
+    """
+    # A token is at least one byte, so short texts can skip tokenization
+    if len(pdf_text.encode("utf-8")) <= INVOICE_TEXT_MAX_TOKENS:
+        return pdf_text
+    
+    tail_tokens = INVOICE_TEXT_MAX_TOKENS - INVOICE_TEXT_HEAD_TOKENS
+    if USE_TIKTOKEN:
+        encoding = _get_token_encoding(openai_model)
+        tokens = encoding.encode(pdf_text)
+        if len(tokens) <= INVOICE_TEXT_MAX_TOKENS:
+            return pdf_text
+        head = encoding.decode(tokens[:INVOICE_TEXT_HEAD_TOKENS])
+        tail = encoding.decode(tokens[-tail_tokens:])
+        original_tokens = len(tokens)
     else:
-        # Standard prompt to extract all details
-        prompt = (
-            "Extract the following details from the invoice text and return them in a strict format of 4 elements separated by ' - ':\n"
-            "1. Service Provider\n"
-            "2. Date in dd_MM_yyyy format\n"
-            "3. Amount in USD (just the number)\n"
-            "4. 'USD'\n\n"
-            f"Text from invoice:\n{pdf_text}\n\n"
-            "Important: Respond ONLY with the 4 elements separated by ' - ' without any additional text."
-        )
+        if len(pdf_text) <= INVOICE_TEXT_MAX_TOKENS * CHARS_PER_TOKEN_ESTIMATE:
+            return pdf_text
+        head = pdf_text[:INVOICE_TEXT_HEAD_TOKENS * CHARS_PER_TOKEN_ESTIMATE]
+        tail = pdf_text[-tail_tokens * CHARS_PER_TOKEN_ESTIMATE:]
+        original_tokens = len(pdf_text) // CHARS_PER_TOKEN_ESTIMATE
+    
+    logger.debug(f"Truncated invoice text from ~{original_tokens} to {INVOICE_TEXT_MAX_TOKENS} tokens")
+    return f"{head}\n...\n{tail}"
+
+
+# Static extraction instructions, sent as the system message. They must stay
+# byte-identical across calls (nothing invoice-specific goes in here) and longer
+# than 1024 tokens so OpenAI's automatic prompt caching kicks in for the prefix.
+_INSTRUCTION_RULES = (
+    "Rules:\n"
+    "- Dates must be written as dd_MM_yyyy with zero-padded day and month, e.g. 05_03_2025.\n"
+    "- Use the invoice (issue) date rather than a due date or the date the document was printed. "
+    "Receipts that only show a payment date use that date.\n"
+    "- Dates in the text may be in any format (March 5, 2025; 2025-03-05; 05/03/2025; 5 Mar 2025). "
+    "Numeric dates with a slash are month/day/year for US companies and day/month/year otherwise.\n"
+    "- The amount is the final total charged in USD, including taxes and after discounts and credits. "
+    "Do not use subtotals, unit prices, balances carried forward or payments of earlier invoices.\n"
+    "- Write the amount as a plain number with a dot as decimal separator and no thousands separators, "
+    "currency symbols or spaces, e.g. 1234.50.\n"
+    "- If the total is zero (fully credited invoice), write 0.00.\n"
+    "- Never wrap the answer in quotes, code blocks or markdown, and never add explanations, "
+    "labels, numbering or a trailing period.\n"
+)
+
+_INSTRUCTION_EXAMPLES = [
+    ("Invoice #INV-20931\nAnthropic, PBC\nDate of issue: March 5, 2025\nClaude Pro subscription $20.00\n"
+     "Tax $0.00\nAmount due $20.00 USD",
+     "Anthropic", "05_03_2025", "20.00"),
+    ("GitHub, Inc.\n88 Colin P Kelly Jr St, San Francisco\nReceipt date 2025-01-31\n"
+     "Copilot Business (3 seats) 57.00\nTotal USD 57.00",
+     "GitHub", "31_01_2025", "57.00"),
+    ("Amazon Web Services, Inc.\nStatement period: Dec 1 - Dec 31, 2024\nInvoice date: 01/02/2025\n"
+     "Subtotal $1,180.42\nCredits -$100.00\nTax $54.04\nTotal amount due: USD 1,134.46",
+     "Amazon Web Services", "02_01_2025", "1134.46"),
+    ("DIGITALOCEAN LLC\nInvoice for April 2025\nDroplets 48.00\nSpaces 5.00\nIssued 2025-05-01\n"
+     "Due 2025-05-15\nTotal: $53.00",
+     "DigitalOcean", "01_05_2025", "53.00"),
+    ("Notion Labs, Inc.\nInvoice number 3B1A-0042\nDate paid 7 Feb 2025\nDate of issue 6 Feb 2025\n"
+     "Plus plan, annual 96.00\nAmount paid $96.00",
+     "Notion", "06_02_2025", "96.00"),
+    ("Google LLC - Google Workspace\nInvoice date: Oct 31, 2024\nBusiness Starter x2 12.00\n"
+     "Previous balance 12.00\nPayments received -12.00\nTotal in USD $14.40 (incl. tax 2.40)",
+     "Google Workspace", "31_10_2024", "14.40"),
+    ("OpenAI, LLC\nReceipt #2211-8823\nDate paid: November 12, 2024\nChatGPT Plus Subscription\n"
+     "Qty 1 $20.00\nTotal $20.00\nAmount paid $20.00",
+     "OpenAI", "12_11_2024", "20.00"),
+    ("JetBrains s.r.o.\nInvoice #A-331029 dated 15.08.2025\nAll Products Pack 289.00 USD\n"
+     "Discount -57.80 USD\nTotal: 231.20 USD",
+     "JetBrains", "15_08_2025", "231.20"),
+    ("Figma, Inc.\nInvoice date 06/30/2025\nProfessional team, 4 editors\nSubtotal 60.00\n"
+     "Credit applied -60.00\nTotal due $0.00",
+     "Figma", "30_06_2025", "0.00"),
+    ("Cloudflare, Inc.\nInvoice 0093312 | Issued 2025-09-09\nWorkers Paid 5.00\nR2 Storage 1.35\n"
+     "Argo Smart Routing 5.00\nGrand total USD 11.35",
+     "Cloudflare", "09_09_2025", "11.35"),
+    ("Invoice\nSlack Technologies, LLC\nInvoice No. SL-77120\nInvoice Date: July 1, 2025\n"
+     "Pro plan, 6 active members x $8.75 = $52.50\nSales tax (8.875%) $4.66\nTotal $57.16",
+     "Slack", "01_07_2025", "57.16"),
+    ("Vercel Inc.\nBilling period Aug 14 2025 - Sep 13 2025\nInvoice date Sep 14 2025\n"
+     "Pro seat x1 20.00\nAdditional bandwidth 100 GB 40.00\nAmount due (USD) 60.00",
+     "Vercel", "14_09_2025", "60.00"),
+    ("ZOOM VIDEO COMMUNICATIONS INC\nInvoice 12-0044719\nDate 12/20/2024\nZoom Workplace Pro Monthly "
+     "$15.99\nTaxes and fees $1.20\nInvoice total $17.19\nPayment due upon receipt",
+     "Zoom", "20_12_2024", "17.19"),
+    ("Atlassian Pty Ltd\nTax invoice IN-004-118-930\nInvoice date 3 Apr 2025\nJira Software (Standard) "
+     "10 users USD 81.50\nConfluence (Standard) 10 users USD 60.50\nTotal (USD) 142.00",
+     "Atlassian", "03_04_2025", "142.00"),
+    ("Microsoft Corporation\nBilling profile: Contoso Ltda\nInvoice date: 2025-02-28\n"
+     "Microsoft 365 Business Standard 3 x 12.50\nCharges 37.50\nTax 0.00\nTotal amount USD 37.50",
+     "Microsoft", "28_02_2025", "37.50"),
+    ("Dropbox, Inc.\nReceipt for your payment\nPayment date: Jan 9, 2025\nDropbox Plus (monthly)\n"
+     "Subtotal US$11.99\nTotal paid US$11.99",
+     "Dropbox", "09_01_2025", "11.99"),
+    ("Adobe Inc.\nInvoice number IEN2025004418823\nInvoice date 2025/06/18\nCreative Cloud All Apps "
+     "59.99\nTax 5.10\nGROSS AMOUNT (USD) 65.09",
+     "Adobe", "18_06_2025", "65.09"),
+]
+
+
+def _format_instruction_examples(include_provider: bool) -> str:
+    """
+    Render the worked examples for the static extraction instructions.
     
-    max_retries = 3
-    retry_delay = 2  # seconds
+    Args:
+        include_provider: Whether the expected answers include the provider
+        
+    Returns:
+        str: Deterministic examples text
+    """
+    rendered = []
+    for i, (invoice_text, provider, date_str, amount) in enumerate(_INSTRUCTION_EXAMPLES, start=1):
+        answer = " - ".join(([provider] if include_provider else []) + [date_str, amount, "USD"])
+        rendered.append(f"Example {i}\nInvoice text:\n{invoice_text}\nAnswer:\n{answer}\n")
+    return "\n".join(rendered)
+
+
+INVOICE_INSTRUCTIONS = (
+    "You extract billing details from the text of invoices and receipts.\n"
+    "Extract the following details from the invoice text and return them in a strict format "
+    "of 4 elements separated by ' - ':\n"
+    "1. Service Provider (the company that issued the invoice, using its common short name "
+    "without legal suffixes such as Inc., LLC or Ltd.)\n"
+    "2. Date in dd_MM_yyyy format\n"
+    "3. Amount in USD (just the number)\n"
+    "4. 'USD'\n\n"
+    + _INSTRUCTION_RULES
+    + "\n" + _format_instruction_examples(include_provider=True) + "\n"
+    "Important: Respond ONLY with the 4 elements separated by ' - ' without any additional text."
+)
+
+INVOICE_INSTRUCTIONS_KNOWN_PROVIDER = (
+    "You extract billing details from the text of invoices and receipts. "
+    "The service provider has already been identified and is given with the invoice text.\n"
+    "Extract ONLY the following details from the invoice text and return them in a strict format "
+    "of 3 elements separated by ' - ':\n"
+    "1. Date in dd_MM_yyyy format\n"
+    "2. Amount in USD (just the number)\n"
+    "3. 'USD'\n\n"
+    + _INSTRUCTION_RULES
+    + "\n" + _format_instruction_examples(include_provider=False) + "\n"
+    "Important: Respond ONLY with the 3 elements separated by ' - ' without any additional text."
+)
+
+
+def _build_invoice_messages(pdf_text: str, provider_from_mapping: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Build the extraction messages for OpenAI.
     
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model=openai_model,
-                messages=[{"role": "user", "content": prompt}],
-                max_completion_tokens=10000
-            )
-            
-            # Log the raw response for debugging
-            logger.debug(f"Raw OpenAI response: {response}")
-            
-            # Check if response has content
-            if not response.choices or not response.choices[0].message:
-                raise ValueError("No choices in OpenAI response")
-                
-            content = response.choices[0].message.content
-            if content is None:
-                raise ValueError("Empty content in OpenAI response")
-                
-            content = content.strip()
-            logger.debug(f"Cleaned content: {content}")
-            
-            if not content:
-                raise ValueError("Empty content after stripping")
-                
-            # If we got here, we have valid content
-            break
-            
-        except Exception as e:
-            if attempt == max_retries - 1:  # Last attempt
-                logger.error(f"Failed to get valid response from OpenAI after {max_retries} attempts: {str(e)}")
-                raise
-            
-            logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay} seconds...")
-            import time
-            time.sleep(retry_delay)
-            retry_delay *= 2  # Exponential backoff
+    The instructions go in a fixed system message so that the prefix of every
+    request is identical and is served from OpenAI's prompt cache; only the
+    user message varies per invoice.
+    
+    Args:
+        pdf_text: The text extracted from the PDF
+        provider_from_mapping: Provider already identified locally, if any
+        
+    Returns:
+        List of chat messages to send to OpenAI
+    """
+    # If we have a provider from mapping, only ask for the date and amount
+    if provider_from_mapping:
+        return [
+            {"role": "system", "content": INVOICE_INSTRUCTIONS_KNOWN_PROVIDER},
+            {"role": "user", "content": f"Service provider: {provider_from_mapping}\n\n"
+                                        f"Text from invoice:\n{pdf_text}"}
+        ]
+    
+    # Standard prompt to extract all details
+    return [
+        {"role": "system", "content": INVOICE_INSTRUCTIONS},
+        {"role": "user", "content": f"Text from invoice:\n{pdf_text}"}
+    ]
+
+
+def _build_chat_request(messages: List[Dict[str, str]], openai_model: str) -> Dict[str, Any]:
+    """
+    Build the chat completion request parameters for the extraction messages.
+    
+    The same parameters are used for real-time calls and Batch API request lines.
+    
+    Args:
+        messages: The extraction messages
+        openai_model: The OpenAI model to use
+        
+    Returns:
+        Dictionary of chat completion parameters
+    """
+    return {
+        "model": openai_model,
+        "messages": messages,
+        "max_completion_tokens": MAX_COMPLETION_TOKENS
+    }
+
+
+def _extract_response_content(response, logger: logging.Logger) -> str:
+    """
+    Validate an OpenAI chat completion response and return its cleaned content.
+    
+    Args:
+        response: The chat completion response
+        logger: Logger instance
+        
+    Returns:
+        str: The stripped message content
+        
+    Raises:
+        ValueError: If the response has no usable content
+    """
+    # Log the raw response for debugging (formatting the whole response is costly)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Raw OpenAI response: {response}")
+    
+    # Check if response has content
+    if not response.choices or not response.choices[0].message:
+        raise ValueError("No choices in OpenAI response")
         
+    content = response.choices[0].message.content
+    if content is None:
+        raise ValueError("Empty content in OpenAI response")
+        
+    content = content.strip()
+    logger.debug(f"Cleaned content: {content}")
+    
+    if not content:
+        raise ValueError("Empty content after stripping")
+    
+    return content
+
+
+# Everything except ASCII digits and the decimal point, dropped from amounts
+# (currency symbols, thousands separators, spaces, ...)
+_NON_AMOUNT_CHARS_RE = re.compile(r'[^0-9.]')
+
+
+def _parse_openai_response(
+    content: str, pdf_text: str, provider_from_mapping: Optional[str], logger: logging.Logger,
+    use_live_rates: bool = False, fallback_rate: float = 5.74
+) -> Tuple[str, str, float, float]:
+    """
+    Parse the ' - '-separated OpenAI answer into invoice details.
+    
+    Args:
+        content: The cleaned OpenAI response content
+        pdf_text: The text extracted from the PDF (used for provider learning)
+        provider_from_mapping: Provider already identified locally, if any
+        logger: Logger instance
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Fallback exchange rate when live rates are disabled/unavailable
+        
+    Returns:
+        Tuple containing (provider, date_str, usd_amount, brl_amount)
+    """
     # Split by delimiter
     details = content.split(" - ")
     logger.debug(f"Split details: {details}")
@@ -257,7 +698,7 @@ def get_invoice_details(
         # Validate and convert USD amount
         try:
             # Remove any non-numeric characters except period
-            clean_usd_amount = ''.join(c for c in usd_amount_str if c.isdigit() or c == '.')
+            clean_usd_amount = _NON_AMOUNT_CHARS_RE.sub('', usd_amount_str)
             usd_amount = float(clean_usd_amount)
         except ValueError:
             logger.error(f"Invalid USD amount: {usd_amount_str}")
@@ -278,6 +719,211 @@ def get_invoice_details(
         raise
 
 
+def _retry_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter for the given (0-based) attempt.
+    
+    The random spread keeps concurrent invoices that hit a rate limit together
+    from all retrying at the same moment.
+    
+    Args:
+        attempt: Number of the attempt that just failed
+        
+    Returns:
+        float: Seconds to wait before the next attempt
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _with_format_feedback(
+    messages: List[Dict[str, str]], content: str, provider_from_mapping: Optional[str], error: Exception
+) -> List[Dict[str, str]]:
+    """
+    Extend the extraction messages with an invalid answer and a request to fix it.
+    
+    Args:
+        messages: The original extraction messages
+        content: The answer that could not be parsed
+        provider_from_mapping: Provider already identified locally, if any
+        error: The parsing error
+        
+    Returns:
+        List of chat messages for the next attempt
+    """
+    expected_elements = 3 if provider_from_mapping else 4
+    return messages + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": f"Your previous answer was invalid: {error}. Return exactly "
+                                    f"{expected_elements} elements separated by ' - ' in the format "
+                                    "described, without any additional text."}
+    ]
+
+
+def get_invoice_details(
+    pdf_text: str, client: OpenAI, openai_model: str, logger: logging.Logger,
+    use_live_rates: bool = False, fallback_rate: float = 5.74
+) -> Tuple[str, str, float, float]:
+    """
+    Extract invoice details from PDF text using OpenAI API.
+    
+    Transient API errors are retried with jittered exponential backoff, and an
+    answer in the wrong format is re-asked with a description of the problem.
+    
+    Args:
+        pdf_text: The text extracted from the PDF
+        client: The OpenAI client
+        openai_model: The OpenAI model to use
+        logger: Logger instance
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Fallback exchange rate when live rates are disabled/unavailable
+        
+    Returns:
+        Tuple containing (provider, date_str, usd_amount, brl_amount)
+    """
+    # First try identifying the provider using our mapping
+    provider_from_mapping = _identify_provider(pdf_text, logger)
+    invoice_text = _truncate_invoice_text(pdf_text, openai_model)
+    messages = _build_invoice_messages(invoice_text, provider_from_mapping)
+    
+    request_messages = messages
+    
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        last_attempt = attempt == OPENAI_MAX_ATTEMPTS - 1
+        try:
+            response = client.chat.completions.create(**_build_chat_request(request_messages, openai_model))
+            content = _extract_response_content(response, logger)
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if last_attempt:
+                logger.error(f"Failed to get valid response from OpenAI after {OPENAI_MAX_ATTEMPTS} attempts: {str(e)}")
+                raise
+            
+            retry_delay = _retry_delay(attempt)
+            logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay:.1f} seconds...")
+            time.sleep(retry_delay)
+            continue
+        
+        try:
+            return _parse_openai_response(
+                content, pdf_text, provider_from_mapping, logger, use_live_rates, fallback_rate
+            )
+        except ValueError as e:
+            if last_attempt:
+                raise
+            
+            # Ask again, telling the model what was wrong with its answer
+            logger.warning(f"Attempt {attempt + 1} returned an invalid answer: {str(e)}. Asking again...")
+            request_messages = _with_format_feedback(messages, content, provider_from_mapping, e)
+
+
+async def get_invoice_details_async(
+    pdf_text: str, client: AsyncOpenAI, openai_model: str, logger: logging.Logger,
+    use_live_rates: bool = False, fallback_rate: float = 5.74
+) -> Tuple[str, str, float, float]:
+    """
+    Async variant of get_invoice_details using the AsyncOpenAI client.
+    
+    Waiting on the API releases the event loop, so many invoices can be
+    in flight at the same time.
+    
+    Args:
+        pdf_text: The text extracted from the PDF
+        client: The AsyncOpenAI client
+        openai_model: The OpenAI model to use
+        logger: Logger instance
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Fallback exchange rate when live rates are disabled/unavailable
+        
+    Returns:
+        Tuple containing (provider, date_str, usd_amount, brl_amount)
+    """
+    # First try identifying the provider using our mapping
+    provider_from_mapping = _identify_provider(pdf_text, logger)
+    invoice_text = _truncate_invoice_text(pdf_text, openai_model)
+    messages = _build_invoice_messages(invoice_text, provider_from_mapping)
+    
+    request_messages = messages
+    
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        last_attempt = attempt == OPENAI_MAX_ATTEMPTS - 1
+        try:
+            response = await client.chat.completions.create(**_build_chat_request(request_messages, openai_model))
+            content = _extract_response_content(response, logger)
+        except RETRYABLE_OPENAI_ERRORS as e:
+            if last_attempt:
+                logger.error(f"Failed to get valid response from OpenAI after {OPENAI_MAX_ATTEMPTS} attempts: {str(e)}")
+                raise
+            
+            retry_delay = _retry_delay(attempt)
+            logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay:.1f} seconds...")
+            await asyncio.sleep(retry_delay)
+            continue
+        
+        try:
+            return _parse_openai_response(
+                content, pdf_text, provider_from_mapping, logger, use_live_rates, fallback_rate
+            )
+        except ValueError as e:
+            if last_attempt:
+                raise
+            
+            # Ask again, telling the model what was wrong with its answer
+            logger.warning(f"Attempt {attempt + 1} returned an invalid answer: {str(e)}. Asking again...")
+            request_messages = _with_format_feedback(messages, content, provider_from_mapping, e)
+
+
+# Last live USD/BRL rate as (rate, time.monotonic() when fetched)
+_live_rate_cache: Optional[Tuple[float, float]] = None
+_live_rate_lock = threading.Lock()
+
+
+def _get_live_usd_brl_rate() -> float:
+    """
+    Return the live USD to BRL exchange rate, fetching it at most once per TTL.
+    
+    The lock is held while fetching so concurrent invoices wait for a single
+    request instead of all hitting the rates service at once.
+    
+    Returns:
+        float: BRL per USD
+    """
+    global _live_rate_cache
+    with _live_rate_lock:
+        if _live_rate_cache is not None:
+            rate, fetched_at = _live_rate_cache
+            if time.monotonic() - fetched_at < LIVE_RATE_TTL_SECONDS:
+                return rate
+        
+        rate = CurrencyRates().get_rate('USD', 'BRL')
+        _live_rate_cache = (rate, time.monotonic())
+        return rate
+
+
+def resolve_usd_brl_rate(use_live_rates: bool, fallback_rate: float) -> float:
+    """
+    Resolve the USD to BRL exchange rate once for a whole run.
+    
+    Every invoice of a run is then converted with the same rate, and a rates
+    service that is down costs one failed request instead of one per invoice.
+    
+    Args:
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Exchange rate to use if live rates are disabled or fail
+        
+    Returns:
+        float: BRL per USD
+    """
+    if not use_live_rates:
+        return fallback_rate
+    try:
+        exchange_rate = _get_live_usd_brl_rate()
+        logger.info(f"Using live exchange rate for this run: USD 1 = BRL {exchange_rate:.2f}")
+        return exchange_rate
+    except Exception as e:
+        logger.warning(f"Error getting live exchange rates: {str(e)}")
+        logger.info(f"Using fallback exchange rate for this run: USD 1 = BRL {fallback_rate:.2f}")
+        return fallback_rate
+
+
 def convert_usd_to_brl(usd_amount: float, 
                   use_live_rates: bool = False, 
                   fallback_rate: float = 5.74) -> float:
@@ -298,13 +944,12 @@ def convert_usd_to_brl(usd_amount: float,
     try:
         if use_live_rates:
             # Attempt to get the current exchange rate
-            c = CurrencyRates()
-            exchange_rate = c.get_rate('USD', 'BRL')
+            exchange_rate = _get_live_usd_brl_rate()
             logger.info(f"Using live exchange rate: USD 1 = BRL {exchange_rate:.2f}")
             return round(usd_amount * exchange_rate, 2)
         else:
-            # Use the fallback rate
-            logger.info(f"Using fallback exchange rate: USD 1 = BRL {fallback_rate:.2f}")
+            # Use the fallback rate (or the rate resolved for the run)
+            logger.debug(f"Using exchange rate: USD 1 = BRL {fallback_rate:.2f}")
             return round(usd_amount * fallback_rate, 2)
     except Exception as e:
         # If there's any error, use the fallback rate
@@ -313,54 +958,452 @@ def convert_usd_to_brl(usd_amount: float,
         return round(usd_amount * fallback_rate, 2)
 
 
-def sanitize_filename(filename: str) -> str:
+# Characters replaced with a hyphen or removed from filenames (after "c/o" -> "-")
+_FILENAME_TRANSLATION = str.maketrans({
+    '/': '-',    # Replace forward slashes
+    '\\': '-',   # Replace backslashes
+    ':': '-',    # Replace colons
+    '|': '-',    # Replace pipes with hyphens
+    '*': None,   # Remove asterisks
+    '?': None,   # Remove question marks
+    '"': None,   # Remove quotes
+    '<': None,   # Remove angle brackets
+    '>': None,   # Remove angle brackets
+})
+
+# Anything that isn't alphanumeric (Unicode-aware, like str.isalnum) or one of "- ./_"
+_FILENAME_DISALLOWED_RE = re.compile(r'[^\w\- ./]')
+
+
+def sanitize_filename(filename: str) -> str:
+    """
+    Sanitize a filename by replacing/removing invalid characters.
+    
+    Args:
+        filename: Original filename
+        
+    Returns:
+        str: Sanitized filename
+    """
+    # Replace "c/o" with a hyphen before slashes are handled individually
+    result = filename.replace('c/o', '-').translate(_FILENAME_TRANSLATION)
+    
+    # Ensure the filename doesn't have any other problematic characters
+    result = _FILENAME_DISALLOWED_RE.sub('', result)
+    
+    return result.strip()
+
+
+def _copy_file_range(input_file: Path, output_file: Path) -> None:
+    """Copy a file's bytes inside the kernel (copy-on-write on btrfs/XFS)."""
+    src_fd = os.open(input_file, os.O_RDONLY)
+    try:
+        dst_fd = os.open(output_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            remaining = os.fstat(src_fd).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def _reflink(input_file: Path, output_file: Path) -> None:
+    """Clone a file's extents copy-on-write (btrfs, XFS); raises OSError where unsupported."""
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_invoice(input_file: Path, output_file: Path, allow_link: bool = True) -> None:
+    """
+    Place a copy of an invoice in the output folder with as little I/O as possible.
+    
+    INVOICE_COPY_MODE selects the method:
+    - auto (default): hard link, then reflink, then a kernel copy
+    - link: hard link, falling back to a kernel copy
+    - reflink: copy-on-write clone, falling back to a kernel copy
+    - copy: always copy the bytes
+    Hard links only work within one filesystem and share the data with the
+    input; reflinks also need btrfs/XFS but leave independent files. Kernel
+    copies use copy_file_range where available, falling back to shutil.copy2.
+    
+    Args:
+        input_file: Path to the input PDF file
+        output_file: Path of the file to create
+        allow_link: False when a hard link was already attempted
+    """
+    copy_mode = os.getenv("INVOICE_COPY_MODE", COPY_MODE_DEFAULT).lower()
+    if allow_link and copy_mode in ("auto", "link"):
+        try:
+            os.link(input_file, output_file)
+            return
+        except OSError:
+            pass  # Different filesystem, or hard links not supported
+    
+    if copy_mode in ("auto", "reflink"):
+        try:
+            _reflink(input_file, output_file)
+            shutil.copystat(input_file, output_file)
+            return
+        except OSError:
+            pass  # Not a copy-on-write filesystem; the copies below overwrite the output
+    
+    if hasattr(os, "copy_file_range"):
+        try:
+            _copy_file_range(input_file, output_file)
+            shutil.copystat(input_file, output_file)
+            return
+        except OSError:
+            pass  # Not supported for these files; copy2 overwrites any partial output
+    
+    shutil.copy2(input_file, output_file)
+
+
+def _reserve_output_file(input_file: Path, output_file: Path) -> bool:
+    """
+    Atomically claim an output file name, so concurrently processed invoices with the
+    same details never overwrite each other.
+    
+    The claim is a hard link of the invoice when the copy mode allows it, otherwise an
+    empty placeholder that the copy overwrites.
+    
+    Args:
+        input_file: Path to the input PDF file
+        output_file: Path of the file to claim
+        
+    Returns:
+        bool: True if the invoice was hard-linked, False if it still has to be copied
+        
+    Raises:
+        FileExistsError: If the name is already taken
+    """
+    copy_mode = os.getenv("INVOICE_COPY_MODE", COPY_MODE_DEFAULT).lower()
+    if copy_mode in ("auto", "link"):
+        try:
+            os.link(input_file, output_file)
+            return True
+        except FileExistsError:
+            raise
+        except OSError:
+            pass  # Different filesystem, or hard links not supported
+    
+    os.close(os.open(output_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+    return False
+
+
+def _save_processed_file(input_file: Path, 
+                         output_folder: Path, 
+                         provider: str, 
+                         date_str: str, 
+                         usd_amount: float, 
+                         brl_amount: float) -> Path:
+    """
+    Copy an invoice to the output folder under its standardized name.
+    
+    Args:
+        input_file: Path to the input PDF file
+        output_folder: Path to the output folder
+        provider: Invoice provider
+        date_str: Invoice date in dd_MM_yyyy format
+        usd_amount: Amount in USD
+        brl_amount: Amount in BRL
+        
+    Returns:
+        Path: The path of the copied file
+    """
+    # Create new filename
+    new_filename = f"{provider} - {date_str} - USD {usd_amount} - BRL {brl_amount}.pdf"
+    sanitized_filename = sanitize_filename(new_filename)
+    
+    # Create output path
+    output_file = output_folder / sanitized_filename
+    
+    try:
+        linked = _reserve_output_file(input_file, output_file)
+    except FileExistsError:
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        base_name = f"{sanitized_filename.replace('.pdf', '')}_{timestamp}"
+        output_file = output_folder / f"{base_name}.pdf"
+        counter = 1
+        while True:
+            try:
+                linked = _reserve_output_file(input_file, output_file)
+                break
+            except FileExistsError:
+                output_file = output_folder / f"{base_name}_{counter}.pdf"
+                counter += 1
+        logger.warning(f"Output file already exists. Using alternative name: {output_file.name}")
+    
+    if not linked:
+        # The name is ours, so other workers' copies run in parallel with this one
+        try:
+            _copy_invoice(input_file, output_file, allow_link=False)
+        except BaseException:
+            output_file.unlink(missing_ok=True)
+            raise
+    
+    logger.info(f"Successfully processed: {input_file.name} → {output_file.name}")
+    return output_file
+
+
+def _log_processing_error(input_file: Path, error: Exception) -> None:
+    """
+    Log a processing failure for a single file according to its error type.
+    
+    Args:
+        input_file: Path to the input PDF file
+        error: The exception raised while processing
+    """
+    if isinstance(error, FileNotFoundError):
+        logger.error(f"File not found error: {str(error)}")
+    elif isinstance(error, ValueError):
+        logger.error(f"Value error processing {input_file.name}: {str(error)}")
+    elif isinstance(error, PDF_READ_ERRORS): # Specific error for PDF reading
+        logger.error(f"PDF Read error processing {input_file.name}: {str(error)}")
+    else:
+        logger.error(f"Error processing {input_file.name}: {str(error)}", exc_info=error)
+
+
+def _lookup_cached_details(
+    input_file: Path, openai_model: str, cache: Optional["ExtractionCache"],
+    use_live_rates: bool, fallback_rate: float
+) -> Tuple[Optional[str], Optional[Tuple[str, str, float, float]]]:
+    """
+    Look up a previous extraction of the exact same PDF in the cache.
+    
+    Only provider, date and USD amount are cached; the BRL amount is recomputed
+    so cached entries always follow the current exchange rate settings.
+    
+    Args:
+        input_file: Path to the input PDF file
+        openai_model: OpenAI model for extraction
+        cache: Extraction cache, or None when caching is disabled
+        use_live_rates: Flag for live exchange rates
+        fallback_rate: Fallback exchange rate
+        
+    Returns:
+        Tuple of (cache key, details); the key is None when caching is disabled
+        and details is None on a cache miss
+    """
+    if cache is None:
+        return None, None
+    
+    key = cache_key(input_file.read_bytes(), openai_model)
+    cached = cache.get(key)
+    if cached is None:
+        return key, None
+    
+    provider, date_str, usd_amount = cached
+    logger.info(f"Using cached extraction for {input_file.name}")
+    brl_amount = convert_usd_to_brl(usd_amount, use_live_rates, fallback_rate)
+    return key, (provider, date_str, usd_amount, brl_amount)
+
+
+def process_file(input_file: Path, 
+                 output_folder: Path, 
+                 openai_model: str, 
+                 use_live_rates: bool, 
+                 fallback_rate: float,
+                 cache: Optional["ExtractionCache"] = None,
+                 pdf_text: Optional[str] = None) -> bool:
+    """
+    Process a single invoice PDF file.
+    
+    Args:
+        input_file: Path to the input PDF file
+        output_folder: Path to the output folder
+        openai_model: OpenAI model for extraction
+        use_live_rates: Flag for live exchange rates
+        fallback_rate: Fallback exchange rate
+        cache: Optional extraction cache to reuse results for identical PDFs
+        pdf_text: Text already extracted from the PDF, to avoid parsing it again
+        
+    Returns:
+        bool: True if processing was successful, False otherwise
+    """
+    logger.info(f"Processing file: {input_file.name}")
+    
+    try:
+        # Ensure input file exists
+        if not input_file.exists():
+            logger.error(f"Input file does not exist: {input_file}")
+            return False
+            
+        key, details = _lookup_cached_details(
+            input_file, openai_model, cache, use_live_rates, fallback_rate
+        )
+        if details is None:
+            # Extract text from PDF
+            if pdf_text is None:
+                pdf_text = extract_text_from_pdf(input_file)
+            
+            # Extract invoice details using OpenAI
+            details = get_invoice_details(
+                pdf_text, client, openai_model, logger, use_live_rates, fallback_rate
+            )
+            if key is not None:
+                cache.set(key, *details[:3])
+        
+        provider, date_str, usd_amount, brl_amount = details
+        _save_processed_file(input_file, output_folder, provider, date_str, usd_amount, brl_amount)
+        return True
+        
+    except Exception as e:
+        _log_processing_error(input_file, e)
+        return False
+
+
+# OpenAI extractions in progress, keyed by invoice text fingerprint and settings,
+# so identical invoices processed at the same time share a single request
+_inflight_extractions: Dict[Tuple[str, str, bool, float], "asyncio.Future"] = {}
+
+
+async def _get_invoice_details_shared(pdf_text: str, 
+                                      async_client: AsyncOpenAI, 
+                                      openai_model: str, 
+                                      use_live_rates: bool, 
+                                      fallback_rate: float) -> Tuple[str, str, float, float]:
+    """
+    Extract invoice details with OpenAI, joining an identical extraction already in flight.
+    
+    Args:
+        pdf_text: The text extracted from the PDF
+        async_client: The AsyncOpenAI client
+        openai_model: OpenAI model for extraction
+        use_live_rates: Flag for live exchange rates
+        fallback_rate: Fallback exchange rate
+        
+    Returns:
+        Tuple containing (provider, date_str, usd_amount, brl_amount)
+    """
+    fingerprint = hashlib.blake2b(pdf_text.encode('utf-8'), digest_size=16).hexdigest()
+    key = (fingerprint, openai_model, use_live_rates, fallback_rate)
+    
+    extraction = _inflight_extractions.get(key)
+    if extraction is None:
+        extraction = asyncio.ensure_future(get_invoice_details_async(
+            pdf_text, async_client, openai_model, logger, use_live_rates, fallback_rate
+        ))
+        _inflight_extractions[key] = extraction
+        extraction.add_done_callback(lambda _: _inflight_extractions.pop(key, None))
+    else:
+        logger.info("Identical invoice text is already being extracted, reusing its result")
+    
+    # Shielded so one cancelled caller doesn't cancel the request for the others
+    return await asyncio.shield(extraction)
+
+
+async def _get_details_async(input_file: Path, 
+                             async_client: AsyncOpenAI, 
+                             openai_model: str, 
+                             use_live_rates: bool, 
+                             fallback_rate: float,
+                             cache: Optional["ExtractionCache"] = None,
+                             pdf_text: Optional[str] = None) -> Tuple[str, str, float, float]:
+    """
+    Get the details of an invoice from the cache, or from OpenAI on a miss.
+    
+    PDF parsing and cache access run in the default executor so they don't
+    block the event loop while other invoices wait on OpenAI.
+    
+    Args:
+        input_file: Path to the input PDF file
+        async_client: The AsyncOpenAI client
+        openai_model: OpenAI model for extraction
+        use_live_rates: Flag for live exchange rates
+        fallback_rate: Fallback exchange rate
+        cache: Optional extraction cache to reuse results for identical PDFs
+        pdf_text: Text already extracted from the PDF, to avoid parsing it again
+        
+    Returns:
+        Tuple containing (provider, date_str, usd_amount, brl_amount)
+    """
+    loop = asyncio.get_running_loop()
+    
+    key, details = await loop.run_in_executor(
+        None, _lookup_cached_details,
+        input_file, openai_model, cache, use_live_rates, fallback_rate
+    )
+    if details is None:
+        # Extract text from PDF
+        if pdf_text is None:
+            pdf_text = await loop.run_in_executor(None, extract_text_from_pdf, input_file)
+        
+        # Extract invoice details using OpenAI
+        details = await _get_invoice_details_shared(
+            pdf_text, async_client, openai_model, use_live_rates, fallback_rate
+        )
+        if key is not None:
+            await loop.run_in_executor(None, cache.set, key, *details[:3])
+    
+    return details
+
+
+async def _extract_and_save_async(input_file: Path, 
+                                  output_folder: Path, 
+                                  async_client: AsyncOpenAI, 
+                                  openai_model: str, 
+                                  use_live_rates: bool, 
+                                  fallback_rate: float,
+                                  cache: Optional["ExtractionCache"] = None,
+                                  pdf_text: Optional[str] = None
+                                  ) -> Tuple[Tuple[str, str, float, float], Path]:
     """
-    Sanitize a filename by replacing/removing invalid characters.
+    Extract the details of an invoice and save its renamed copy.
+    
+    The file copy runs in the default executor, like the PDF parsing.
     
     Args:
-        filename: Original filename
+        input_file: Path to the input PDF file
+        output_folder: Path to the output folder
+        async_client: The AsyncOpenAI client
+        openai_model: OpenAI model for extraction
+        use_live_rates: Flag for live exchange rates
+        fallback_rate: Fallback exchange rate
+        cache: Optional extraction cache to reuse results for identical PDFs
+        pdf_text: Text already extracted from the PDF, to avoid parsing it again
         
     Returns:
-        str: Sanitized filename
+        Tuple of ((provider, date_str, usd_amount, brl_amount), output file path)
     """
-    # Replace problematic characters/phrases
-    replacements = {
-        'c/o': '-',  # Replace "c/o" with a hyphen
-        '/': '-',    # Replace forward slashes
-        '\\': '-',   # Replace backslashes
-        ':': '-',    # Replace colons
-        '*': '',     # Remove asterisks
-        '?': '',     # Remove question marks
-        '"': '',     # Remove quotes
-        '<': '',     # Remove angle brackets
-        '>': '',     # Remove angle brackets
-        '|': '-',    # Replace pipes with hyphens
-    }
-    
-    result = filename
-    for old, new in replacements.items():
-        result = result.replace(old, new)
-    
-    # Ensure the filename doesn't have any other problematic characters
-    result = "".join(c for c in result if c.isalnum() or c in "- ./_")
+    details = await _get_details_async(
+        input_file, async_client, openai_model, use_live_rates, fallback_rate, cache, pdf_text
+    )
     
-    return result.strip()
+    provider, date_str, usd_amount, brl_amount = details
+    output_file = await asyncio.get_running_loop().run_in_executor(
+        None, _save_processed_file,
+        input_file, output_folder, provider, date_str, usd_amount, brl_amount
+    )
+    return details, output_file
 
 
-def process_file(input_file: Path, 
-                 output_folder: Path, 
-                 openai_model: str, 
-                 use_live_rates: bool, 
-                 fallback_rate: float) -> bool:
+async def process_file_async(input_file: Path, 
+                             output_folder: Path, 
+                             async_client: AsyncOpenAI, 
+                             openai_model: str, 
+                             use_live_rates: bool, 
+                             fallback_rate: float,
+                             cache: Optional["ExtractionCache"] = None,
+                             pdf_text: Optional[str] = None) -> bool:
     """
-    Process a single invoice PDF file.
+    Async variant of process_file.
     
     Args:
         input_file: Path to the input PDF file
         output_folder: Path to the output folder
+        async_client: The AsyncOpenAI client
         openai_model: OpenAI model for extraction
         use_live_rates: Flag for live exchange rates
         fallback_rate: Fallback exchange rate
+        cache: Optional extraction cache to reuse results for identical PDFs
+        pdf_text: Text already extracted from the PDF, to avoid parsing it again
         
     Returns:
         bool: True if processing was successful, False otherwise
@@ -372,54 +1415,98 @@ def process_file(input_file: Path,
         if not input_file.exists():
             logger.error(f"Input file does not exist: {input_file}")
             return False
-            
-        # Extract text from PDF
-        pdf_text = extract_text_from_pdf(input_file)
         
-        # Extract invoice details using OpenAI
-        provider, date_str, usd_amount, brl_amount = get_invoice_details(
-            pdf_text, client, openai_model, logger, use_live_rates, fallback_rate
+        await _extract_and_save_async(
+            input_file, output_folder, async_client, openai_model,
+            use_live_rates, fallback_rate, cache, pdf_text
         )
-        
-        # Create new filename
-        new_filename = f"{provider} - {date_str} - USD {usd_amount} - BRL {brl_amount}.pdf"
-        sanitized_filename = sanitize_filename(new_filename)
-        
-        # Create output path
-        output_file = output_folder / sanitized_filename
-        
-        # Check if output file already exists
-        if output_file.exists():
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            output_file = output_folder / f"{sanitized_filename.replace('.pdf', '')}_{timestamp}.pdf"
-            logger.warning(f"Output file already exists. Using alternative name: {output_file.name}")
-        
-        # Copy file to output location
-        import shutil
-        shutil.copy2(input_file, output_file)
-        
-        logger.info(f"Successfully processed: {input_file.name} → {output_file.name}")
         return True
         
-    except FileNotFoundError as e:
-        logger.error(f"File not found error: {str(e)}")
-        return False
-    except ValueError as e:
-        logger.error(f"Value error processing {input_file.name}: {str(e)}")
-        return False
-    except PyPDF2.errors.PdfReadError as e: # Specific error for PDF reading
-        logger.error(f"PDF Read error processing {input_file.name}: {str(e)}")
-        return False
     except Exception as e:
-        logger.error(f"Error processing {input_file.name}: {str(e)}", exc_info=True)
+        _log_processing_error(input_file, e)
         return False
 
 
+def _list_pdf_files(input_folder: Path) -> List[Path]:
+    """
+    List the PDF files directly inside a folder.
+    
+    os.scandir answers is_file() from the directory entry itself on most
+    platforms, so this avoids a stat call per file.
+    
+    Args:
+        input_folder: Folder to scan
+        
+    Returns:
+        List of paths to PDF files, in directory order
+    """
+    with os.scandir(input_folder) as entries:
+        # len() > 4 skips a bare ".pdf", which is a hidden file without a suffix
+        return [Path(entry.path) for entry in entries
+                if len(entry.name) > 4 and entry.name.lower().endswith('.pdf') and entry.is_file()]
+
+
+def _resolve_concurrency(concurrency: Optional[int]) -> int:
+    """
+    Resolve the number of concurrent OpenAI requests.
+    
+    Args:
+        concurrency: Explicit value, or None to use OPENAI_CONCURRENCY / the default
+        
+    Returns:
+        int: Number of requests allowed in flight (at least 1)
+    """
+    if concurrency is None:
+        concurrency = int(os.getenv("OPENAI_CONCURRENCY", OPENAI_CONCURRENCY_DEFAULT))
+    return max(1, concurrency)
+
+
+def _create_async_client(concurrency: int) -> AsyncOpenAI:
+    """
+    Create the AsyncOpenAI client shared by all requests of a run.
+    
+    Its connection pool is sized to the number of concurrent requests, so every
+    in-flight request reuses a kept-alive connection instead of paying for a
+    new TLS handshake.
+    
+    Args:
+        concurrency: Maximum concurrent OpenAI requests
+        
+    Returns:
+        AsyncOpenAI: The client (closing it also closes its connection pool)
+    """
+    http_client = DefaultAsyncHttpxClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+
+
+def _install_worker_pool() -> int:
+    """
+    Give the running event loop a dedicated thread pool for blocking work.
+    
+    PDF parsing, validation, cache access and file copies run in this pool
+    (through run_in_executor), next to the in-flight OpenAI requests.
+    asyncio.run() shuts the pool down when the loop closes.
+    
+    Returns:
+        int: Number of worker threads (WORKERS or the default, at least 1)
+    """
+    workers = max(1, int(os.getenv("WORKERS", WORKERS_DEFAULT)))
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="invoice-worker")
+    )
+    return workers
+
+
 def main(input_folder: Path, 
          output_folder: Path, 
          openai_model: str, 
          use_live_rates: bool, 
-         fallback_rate: float) -> None:
+         fallback_rate: float,
+         concurrency: Optional[int] = None,
+         cache: Optional["ExtractionCache"] = None) -> None:
     """
     Main function to process all PDF invoices in the input folder.
     
@@ -429,6 +1516,31 @@ def main(input_folder: Path,
         openai_model: OpenAI model to use
         use_live_rates: Flag for live exchange rates
         fallback_rate: Fallback exchange rate
+        concurrency: Maximum concurrent OpenAI requests (default: OPENAI_CONCURRENCY or 8)
+        cache: Optional extraction cache to reuse results for identical PDFs
+    """
+    asyncio.run(main_async(input_folder, output_folder, openai_model,
+                           use_live_rates, fallback_rate, concurrency, cache))
+
+
+async def main_async(input_folder: Path, 
+                     output_folder: Path, 
+                     openai_model: str, 
+                     use_live_rates: bool, 
+                     fallback_rate: float,
+                     concurrency: Optional[int] = None,
+                     cache: Optional["ExtractionCache"] = None) -> None:
+    """
+    Process all PDF invoices in the input folder concurrently.
+    
+    Args:
+        input_folder: Path to folder containing input invoices
+        output_folder: Path to folder for processed invoices
+        openai_model: OpenAI model to use
+        use_live_rates: Flag for live exchange rates
+        fallback_rate: Fallback exchange rate
+        concurrency: Maximum concurrent OpenAI requests (default: OPENAI_CONCURRENCY or 8)
+        cache: Optional extraction cache to reuse results for identical PDFs
     """
     logger.info(f"Starting invoice processing")
     logger.info(f"Input folder: {input_folder}")
@@ -444,24 +1556,45 @@ def main(input_folder: Path,
     skipped_count = 0
     
     # Get list of PDF files
-    pdf_files = [f for f in input_folder.iterdir() if f.is_file() and f.suffix.lower() == '.pdf']
+    pdf_files = _list_pdf_files(input_folder)
     total_files = len(pdf_files)
     
     if total_files == 0:
         logger.warning(f"No PDF files found in {input_folder}")
         return
     
-    logger.info(f"Found {total_files} PDF files to process")
+    # Fetch the exchange rate once instead of per invoice
+    fallback_rate = resolve_usd_brl_rate(use_live_rates, fallback_rate)
+    use_live_rates = False
     
-    # Process each file with tqdm progress bar
-    for filepath in tqdm(pdf_files, desc="Processing Invoices", unit="file"):
-        # logger.info(f"Processing file: {filepath.name}") # Redundant with tqdm
-        
-        if process_file(filepath, output_folder, openai_model, use_live_rates, fallback_rate):
-            processed_count += 1
-        else:
-            failed_files.append(filepath.name)
-            skipped_count += 1
+    concurrency = _resolve_concurrency(concurrency)
+    workers = _install_worker_pool()
+    logger.info(f"Found {total_files} PDF files to process "
+                f"({concurrency} concurrent requests, {workers} worker threads)")
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    async_client = _create_async_client(concurrency)
+    
+    async def process_one(filepath: Path) -> Tuple[Path, bool]:
+        async with semaphore:
+            success = await process_file_async(
+                filepath, output_folder, async_client, openai_model, use_live_rates, fallback_rate, cache
+            )
+        return filepath, success
+    
+    try:
+        tasks = [asyncio.ensure_future(process_one(f)) for f in pdf_files]
+        # Process files concurrently with tqdm progress bar
+        for finished in async_tqdm.as_completed(tasks, total=total_files,
+                                                desc="Processing Invoices", unit="file"):
+            filepath, success = await finished
+            if success:
+                processed_count += 1
+            else:
+                failed_files.append(filepath.name)
+                skipped_count += 1
+    finally:
+        await async_client.close()
     
     # Summary
     logger.info(f"\nProcessing complete: {processed_count} successful, {skipped_count} failed")
@@ -500,20 +1633,12 @@ def validate_file(input_file: Path) -> Dict[str, Union[bool, str]]:
             
         result["file_size"] = input_file.stat().st_size
         
-        # Try to read PDF
-        with open(input_file, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            result["pages"] = len(reader.pages)
-            result["readable"] = True
-            
-            # Extract text to check if it has content
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text() or ""
-                text += page_text
-            
-            result["has_text"] = len(text.strip()) > 0
-            result["valid"] = result["readable"] and result["has_text"]
+        # Read the PDF and extract its text to check if it has content
+        text, result["pages"] = _read_pdf(input_file)
+        result["readable"] = True
+        
+        result["has_text"] = len(text.strip()) > 0
+        result["valid"] = result["readable"] and result["has_text"]
             
     except Exception as e:
         result["error"] = str(e)
@@ -539,21 +1664,10 @@ def export_results_csv(results: List[Dict], output_file: Path) -> None:
     ]
     
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        # Missing fields are written empty and extra result keys are skipped
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, restval="", extrasaction="ignore")
         writer.writeheader()
-        
-        for result in results:
-            writer.writerow({
-                "filename": result.get("filename", ""),
-                "provider": result.get("provider", ""),
-                "date": result.get("date", ""),
-                "usd_amount": result.get("usd_amount", ""),
-                "brl_amount": result.get("brl_amount", ""),
-                "status": result.get("status", ""),
-                "error_message": result.get("error_message", ""),
-                "processing_time": result.get("processing_time", ""),
-                "output_filename": result.get("output_filename", "")
-            })
+        writer.writerows(results)
     
     logger.info(f"Exported {len(results)} results to {output_file}")
 
@@ -578,8 +1692,13 @@ def export_results_json(results: List[Dict], output_file: Path) -> None:
         "results": results
     }
     
-    with open(output_file, 'w', encoding='utf-8') as jsonfile:
-        json_module.dump(export_data, jsonfile, indent=2, ensure_ascii=False)
+    if USE_ORJSON:
+        # orjson always writes UTF-8 without escaping non-ASCII characters
+        with open(output_file, 'wb') as jsonfile:
+            jsonfile.write(orjson.dumps(export_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as jsonfile:
+            json_module.dump(export_data, jsonfile, indent=2, ensure_ascii=False)
     
     logger.info(f"Exported {len(results)} results to {output_file}")
 
@@ -597,56 +1716,159 @@ def generate_processing_stats(results: List[Dict]) -> Dict:
     if not results:
         return {}
     
-    successful_results = [r for r in results if r.get("status") == "success"]
-    failed_results = [r for r in results if r.get("status") == "failed"]
+    # Collect everything in a single pass over the results; the numbers go into
+    # packed double arrays, which take 8 bytes per file instead of a float object
+    successful = 0
+    failed = 0
+    provider_counts: Counter = Counter()
+    error_counts: Counter = Counter()
+    usd_amounts = array.array('d')
+    brl_amounts = array.array('d')
+    processing_times = array.array('d')
     
-    # Provider statistics
-    provider_counts = {}
-    for result in successful_results:
-        provider = result.get("provider", "Unknown")
-        provider_counts[provider] = provider_counts.get(provider, 0) + 1
-    
-    # Amount statistics
-    usd_amounts = [r.get("usd_amount", 0) for r in successful_results if isinstance(r.get("usd_amount"), (int, float))]
-    brl_amounts = [r.get("brl_amount", 0) for r in successful_results if isinstance(r.get("brl_amount"), (int, float))]
+    for result in results:
+        status = result.get("status")
+        if status == "success":
+            successful += 1
+            provider_counts[result.get("provider", "Unknown")] += 1
+            usd_amount = result.get("usd_amount")
+            if isinstance(usd_amount, (int, float)):
+                usd_amounts.append(usd_amount)
+            brl_amount = result.get("brl_amount")
+            if isinstance(brl_amount, (int, float)):
+                brl_amounts.append(brl_amount)
+        elif status == "failed":
+            failed += 1
+            error_counts[result.get("error_message", "Unknown error")] += 1
+        
+        processing_time = result.get("processing_time")
+        if isinstance(processing_time, (int, float)):
+            processing_times.append(processing_time)
     
-    # Processing time statistics
-    processing_times = [r.get("processing_time", 0) for r in results if isinstance(r.get("processing_time"), (int, float))]
+    total_usd = sum(usd_amounts)
+    total_brl = sum(brl_amounts)
+    total_time = sum(processing_times)
     
     stats = {
         "summary": {
             "total_files": len(results),
-            "successful": len(successful_results),
-            "failed": len(failed_results),
-            "success_rate": (len(successful_results) / len(results)) * 100 if results else 0
+            "successful": successful,
+            "failed": failed,
+            "success_rate": (successful / len(results)) * 100
         },
-        "providers": provider_counts,
+        "providers": dict(provider_counts),
         "amounts": {
-            "total_usd": sum(usd_amounts),
-            "total_brl": sum(brl_amounts),
-            "average_usd": sum(usd_amounts) / len(usd_amounts) if usd_amounts else 0,
-            "average_brl": sum(brl_amounts) / len(brl_amounts) if brl_amounts else 0,
+            "total_usd": total_usd,
+            "total_brl": total_brl,
+            "average_usd": total_usd / len(usd_amounts) if usd_amounts else 0,
+            "average_brl": total_brl / len(brl_amounts) if brl_amounts else 0,
             "max_usd": max(usd_amounts) if usd_amounts else 0,
             "min_usd": min(usd_amounts) if usd_amounts else 0
         },
         "performance": {
-            "total_processing_time": sum(processing_times),
-            "average_time_per_file": sum(processing_times) / len(processing_times) if processing_times else 0,
+            "total_processing_time": total_time,
+            "average_time_per_file": total_time / len(processing_times) if processing_times else 0,
             "fastest_file": min(processing_times) if processing_times else 0,
             "slowest_file": max(processing_times) if processing_times else 0
         },
-        "errors": {}
+        "errors": dict(error_counts)
     }
     
-    # Error analysis
-    error_counts = {}
-    for result in failed_results:
-        error = result.get("error_message", "Unknown error")
-        error_counts[error] = error_counts.get(error, 0) + 1
+    return stats
+
+
+async def _process_batch_entry(
+    filepath: Path, 
+    output_folder: Path, 
+    async_client: Optional[AsyncOpenAI], 
+    openai_model: str, 
+    use_live_rates: bool, 
+    fallback_rate: float,
+    mode: str,
+    cache: Optional["ExtractionCache"] = None
+) -> Dict:
+    """
+    Process a single file for process_batch_with_stats and build its result record.
     
-    stats["errors"] = error_counts
+    Args:
+        filepath: Path to the input PDF file
+        output_folder: Path to output folder
+        async_client: The AsyncOpenAI client (None in 'validate' mode)
+        openai_model: OpenAI model to use
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Fallback exchange rate
+        mode: Processing mode ('process', 'validate', 'dry-run')
+        cache: Optional extraction cache to reuse results for identical PDFs
+        
+    Returns:
+        Dictionary with the processing result for the file
+    """
+    loop = asyncio.get_running_loop()
+    start_time = datetime.now()
+    result = {
+        "filename": filepath.name,
+        "start_time": start_time.isoformat(),
+        "status": "pending"
+    }
     
-    return stats
+    try:
+        if mode == "validate":
+            # Validation mode
+            validation = await loop.run_in_executor(None, validate_file, filepath)
+            result.update({
+                "status": "success" if validation["valid"] else "failed",
+                "valid": validation["valid"],
+                "readable": validation["readable"],
+                "has_text": validation["has_text"],
+                "pages": validation["pages"],
+                "file_size": validation["file_size"],
+                "error_message": validation["error"]
+            })
+            
+        elif mode == "dry-run":
+            # Dry run mode - extract but don't save
+            provider, date_str, usd_amount, brl_amount = await _get_details_async(
+                filepath, async_client, openai_model, use_live_rates, fallback_rate, cache
+            )
+            
+            result.update({
+                "status": "success",
+                "provider": provider,
+                "date": date_str,
+                "usd_amount": usd_amount,
+                "brl_amount": brl_amount,
+                "would_output_filename": f"{provider} - {date_str} - USD {usd_amount} - BRL {brl_amount}.pdf"
+            })
+            
+        else:  # process mode
+            # Normal processing mode
+            logger.info(f"Processing file: {filepath.name}")
+            details, output_file = await _extract_and_save_async(
+                filepath, output_folder, async_client, openai_model, use_live_rates, fallback_rate, cache
+            )
+            provider, date_str, usd_amount, brl_amount = details
+            
+            result.update({
+                "status": "success",
+                "provider": provider,
+                "date": date_str,
+                "usd_amount": usd_amount,
+                "brl_amount": brl_amount,
+                "output_filename": output_file.name
+            })
+                
+    except Exception as e:
+        result["status"] = "failed"
+        result["error_message"] = str(e)
+        logger.error(f"Error processing {filepath.name}: {str(e)}")
+    
+    # Calculate processing time
+    end_time = datetime.now()
+    processing_time = (end_time - start_time).total_seconds()
+    result["processing_time"] = processing_time
+    result["end_time"] = end_time.isoformat()
+    
+    return result
 
 
 def process_batch_with_stats(
@@ -655,11 +1877,52 @@ def process_batch_with_stats(
     openai_model: str, 
     use_live_rates: bool, 
     fallback_rate: float,
-    mode: str = "process"
+    mode: str = "process",
+    concurrency: Optional[int] = None,
+    cache: Optional["ExtractionCache"] = None
 ) -> Tuple[List[Dict], Dict]:
     """
     Process batch with different modes and collect statistics.
     
+    Args:
+        input_folder: Path to input folder
+        output_folder: Path to output folder
+        openai_model: OpenAI model to use
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Fallback exchange rate
+        mode: Processing mode ('process', 'validate', 'dry-run', 'batch')
+        concurrency: Maximum concurrent OpenAI requests (default: OPENAI_CONCURRENCY or 8)
+        cache: Optional extraction cache to reuse results for identical PDFs
+        
+    Returns:
+        Tuple of (results, statistics)
+    """
+    if mode == "batch":
+        results = process_with_batch_api(
+            input_folder, output_folder, openai_model, use_live_rates, fallback_rate, cache=cache
+        )
+        return results, generate_processing_stats(results)
+    
+    return asyncio.run(process_batch_with_stats_async(
+        input_folder, output_folder, openai_model, use_live_rates, fallback_rate, mode, concurrency, cache
+    ))
+
+
+async def process_batch_with_stats_async(
+    input_folder: Path, 
+    output_folder: Path, 
+    openai_model: str, 
+    use_live_rates: bool, 
+    fallback_rate: float,
+    mode: str = "process",
+    concurrency: Optional[int] = None,
+    cache: Optional["ExtractionCache"] = None
+) -> Tuple[List[Dict], Dict]:
+    """
+    Async implementation of process_batch_with_stats.
+    
+    Files are processed concurrently; results keep the order of the input files.
+    
     Args:
         input_folder: Path to input folder
         output_folder: Path to output folder
@@ -667,6 +1930,8 @@ def process_batch_with_stats(
         use_live_rates: Whether to use live exchange rates
         fallback_rate: Fallback exchange rate
         mode: Processing mode ('process', 'validate', 'dry-run')
+        concurrency: Maximum concurrent OpenAI requests (default: OPENAI_CONCURRENCY or 8)
+        cache: Optional extraction cache to reuse results for identical PDFs
         
     Returns:
         Tuple of (results, statistics)
@@ -679,90 +1944,46 @@ def process_batch_with_stats(
         output_folder.mkdir(exist_ok=True, parents=True)
     
     # Get list of PDF files
-    pdf_files = [f for f in input_folder.iterdir() if f.is_file() and f.suffix.lower() == '.pdf']
+    pdf_files = _list_pdf_files(input_folder)
     total_files = len(pdf_files)
     
     if total_files == 0:
         logger.warning(f"No PDF files found in {input_folder}")
         return [], {}
     
-    logger.info(f"Found {total_files} PDF files to process")
+    if mode != "validate":
+        # Fetch the exchange rate once instead of per invoice
+        fallback_rate = resolve_usd_brl_rate(use_live_rates, fallback_rate)
+        use_live_rates = False
     
-    results = []
+    concurrency = _resolve_concurrency(concurrency)
+    workers = _install_worker_pool()
+    logger.info(f"Found {total_files} PDF files to process "
+                f"({concurrency} concurrent requests, {workers} worker threads)")
     
-    # Process each file with progress bar
-    for filepath in tqdm(pdf_files, desc=f"Processing ({mode})", unit="file"):
-        start_time = datetime.now()
-        result = {
-            "filename": filepath.name,
-            "start_time": start_time.isoformat(),
-            "status": "pending"
-        }
-        
-        try:
-            if mode == "validate":
-                # Validation mode
-                validation = validate_file(filepath)
-                result.update({
-                    "status": "success" if validation["valid"] else "failed",
-                    "valid": validation["valid"],
-                    "readable": validation["readable"],
-                    "has_text": validation["has_text"],
-                    "pages": validation["pages"],
-                    "file_size": validation["file_size"],
-                    "error_message": validation["error"]
-                })
-                
-            elif mode == "dry-run":
-                # Dry run mode - extract but don't save
-                pdf_text = extract_text_from_pdf(filepath)
-                provider, date_str, usd_amount, brl_amount = get_invoice_details(
-                    pdf_text, client, openai_model, logger, use_live_rates, fallback_rate
-                )
-                
-                result.update({
-                    "status": "success",
-                    "provider": provider,
-                    "date": date_str,
-                    "usd_amount": usd_amount,
-                    "brl_amount": brl_amount,
-                    "would_output_filename": f"{provider} - {date_str} - USD {usd_amount} - BRL {brl_amount}.pdf"
-                })
-                
-            else:  # process mode
-                # Normal processing mode
-                success = process_file(filepath, output_folder, openai_model, use_live_rates, fallback_rate)
-                
-                if success:
-                    result["status"] = "success"
-                    # Try to extract the details from the output filename
-                    output_files = list(output_folder.glob(f"*{filepath.stem.replace('Invoice-', '')}*.pdf"))
-                    if output_files:
-                        output_file = output_files[0]
-                        result["output_filename"] = output_file.name
-                        # Parse details from filename (basic parsing)
-                        parts = output_file.stem.split(" - ")
-                        if len(parts) >= 4:
-                            result["provider"] = parts[0]
-                            result["date"] = parts[1]
-                            result["usd_amount"] = parts[2].replace("USD", "").strip()
-                            result["brl_amount"] = parts[3].replace("BRL", "").strip()
-                else:
-                    result["status"] = "failed"
-                    result["error_message"] = "Processing failed"
-                    
-        except Exception as e:
-            result["status"] = "failed"
-            result["error_message"] = str(e)
-            logger.error(f"Error processing {filepath.name}: {str(e)}")
-        
-        # Calculate processing time
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
-        result["processing_time"] = processing_time
-        result["end_time"] = end_time.isoformat()
-        
-        results.append(result)
+    semaphore = asyncio.Semaphore(concurrency)
+    # Validation never talks to OpenAI
+    async_client = _create_async_client(concurrency) if mode != "validate" else None
+    results: List[Optional[Dict]] = [None] * total_files
+    
+    async def process_one(index: int, filepath: Path) -> Tuple[int, Dict]:
+        async with semaphore:
+            result = await _process_batch_entry(
+                filepath, output_folder, async_client, openai_model,
+                use_live_rates, fallback_rate, mode, cache
+            )
+        return index, result
+    
+    try:
+        tasks = [asyncio.ensure_future(process_one(i, f)) for i, f in enumerate(pdf_files)]
+        # Process files concurrently with progress bar
+        for finished in async_tqdm.as_completed(tasks, total=total_files,
+                                                desc=f"Processing ({mode})", unit="file"):
+            index, result = await finished
+            results[index] = result
+    finally:
+        if async_client is not None:
+            await async_client.close()
     
     # Generate statistics
     stats = generate_processing_stats(results)
@@ -770,9 +1991,211 @@ def process_batch_with_stats(
     return results, stats
 
 
-if __name__ == "__main__":
-    import argparse
+def _batch_line_content(line: Dict[str, Any]) -> str:
+    """
+    Extract the message content from one line of a Batch API output file.
+    
+    Args:
+        line: Parsed JSON line from the batch output file
+        
+    Returns:
+        str: The stripped message content
+        
+    Raises:
+        ValueError: If the request failed or returned no usable content
+    """
+    if line.get("error"):
+        raise ValueError(f"Batch request failed: {line['error']}")
+    
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        raise ValueError(f"Batch request returned status {response.get('status_code')}")
+    
+    choices = response.get("body", {}).get("choices") or []
+    if not choices or not choices[0].get("message"):
+        raise ValueError("No choices in OpenAI response")
+    
+    content = (choices[0]["message"].get("content") or "").strip()
+    if not content:
+        raise ValueError("Empty content in OpenAI response")
+    
+    return content
+
+
+def _record_batch_success(
+    result: Dict, filepath: Path, output_folder: Path, details: Tuple[str, str, float, float]
+) -> None:
+    """
+    Save a processed file from a batch run and record its details in the result.
+    
+    Args:
+        result: Result dictionary for the file (updated in place)
+        filepath: Path to the input PDF file
+        output_folder: Path to output folder
+        details: Tuple of (provider, date_str, usd_amount, brl_amount)
+    """
+    provider, date_str, usd_amount, brl_amount = details
+    output_file = _save_processed_file(
+        filepath, output_folder, provider, date_str, usd_amount, brl_amount
+    )
+    result.update({
+        "status": "success",
+        "provider": provider,
+        "date": date_str,
+        "usd_amount": usd_amount,
+        "brl_amount": brl_amount,
+        "output_filename": output_file.name
+    })
+
+
+def process_with_batch_api(
+    input_folder: Path, 
+    output_folder: Path, 
+    openai_model: str, 
+    use_live_rates: bool, 
+    fallback_rate: float,
+    poll_interval: float = BATCH_POLL_INTERVAL_DEFAULT,
+    cache: Optional["ExtractionCache"] = None
+) -> List[Dict]:
+    """
+    Process all PDF invoices in the input folder through the OpenAI Batch API.
+    
+    All extraction requests are uploaded as a single JSONL file and completed
+    asynchronously by OpenAI (within 24h, at a reduced price). This function
+    polls until the batch finishes and then saves the renamed files.
+    
+    Args:
+        input_folder: Path to input folder
+        output_folder: Path to output folder
+        openai_model: OpenAI model to use
+        use_live_rates: Whether to use live exchange rates
+        fallback_rate: Fallback exchange rate
+        poll_interval: Seconds to wait between batch status checks
+        cache: Optional extraction cache; cached PDFs are not sent to the batch
+        
+    Returns:
+        List of processing result dictionaries
+    """
+    logger.info("Starting batch processing through the OpenAI Batch API")
+    
+    # Ensure folders exist
+    input_folder.mkdir(exist_ok=True, parents=True)
+    output_folder.mkdir(exist_ok=True, parents=True)
+    
+    # Get list of PDF files
+    pdf_files = _list_pdf_files(input_folder)
+    if not pdf_files:
+        logger.warning(f"No PDF files found in {input_folder}")
+        return []
+    
+    # Fetch the exchange rate once instead of per invoice
+    fallback_rate = resolve_usd_brl_rate(use_live_rates, fallback_rate)
+    use_live_rates = False
+    
+    start_time = datetime.now()
+    results: Dict[str, Dict] = {}
+    # custom_id -> (input file, extracted text, provider from mapping, cache key)
+    pending: Dict[str, Tuple[Path, str, Optional[str], Optional[str]]] = {}
+    
+    # Extract text locally and build one request line per PDF
+    with tempfile.NamedTemporaryFile(mode='w', suffix=".jsonl", delete=False, encoding='utf-8') as batch_f:
+        batch_input_path = Path(batch_f.name)
+        for filepath in pdf_files:
+            results[filepath.name] = {
+                "filename": filepath.name,
+                "start_time": start_time.isoformat(),
+                "status": "pending"
+            }
+            try:
+                key, details = _lookup_cached_details(
+                    filepath, openai_model, cache, use_live_rates, fallback_rate
+                )
+                if details is not None:
+                    _record_batch_success(results[filepath.name], filepath, output_folder, details)
+                    continue
+                pdf_text = extract_text_from_pdf(filepath)
+            except Exception as e:
+                results[filepath.name].update({"status": "failed", "error_message": str(e)})
+                logger.error(f"Error processing {filepath.name}: {str(e)}")
+                continue
+            
+            provider_from_mapping = _identify_provider(pdf_text, logger)
+            invoice_text = _truncate_invoice_text(pdf_text, openai_model)
+            messages = _build_invoice_messages(invoice_text, provider_from_mapping)
+            batch_f.write(json_module.dumps({
+                "custom_id": filepath.name,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": _build_chat_request(messages, openai_model)
+            }) + "\n")
+            pending[filepath.name] = (filepath, pdf_text, provider_from_mapping, key)
+    
+    try:
+        if pending:
+            with open(batch_input_path, 'rb') as batch_file:
+                uploaded = client.files.create(file=batch_file, purpose="batch")
+            batch = client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            logger.info(f"Submitted batch {batch.id} with {len(pending)} requests")
+            
+            # Poll until the batch reaches a terminal state
+            while batch.status not in BATCH_TERMINAL_STATUSES:
+                logger.info(f"Batch {batch.id} status: {batch.status}. Checking again in {poll_interval} seconds...")
+                time.sleep(poll_interval)
+                batch = client.batches.retrieve(batch.id)
+            
+            logger.info(f"Batch {batch.id} finished with status: {batch.status}")
+            
+            # Map each output line back to its file
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for raw_line in client.files.content(file_id).text.splitlines():
+                    if not raw_line.strip():
+                        continue
+                    line = json_module.loads(raw_line)
+                    custom_id = line.get("custom_id")
+                    if custom_id not in pending:
+                        logger.warning(f"Ignoring batch result for unknown request: {custom_id}")
+                        continue
+                    
+                    filepath, pdf_text, provider_from_mapping, key = pending.pop(custom_id)
+                    result = results[custom_id]
+                    try:
+                        content = _batch_line_content(line)
+                        details = _parse_openai_response(
+                            content, pdf_text, provider_from_mapping, logger, use_live_rates, fallback_rate
+                        )
+                        if key is not None:
+                            cache.set(key, *details[:3])
+                        _record_batch_success(result, filepath, output_folder, details)
+                    except Exception as e:
+                        result.update({"status": "failed", "error_message": str(e)})
+                        logger.error(f"Error processing {custom_id}: {str(e)}")
+            
+            # Anything left never got a result line (expired, cancelled, failed batch)
+            for custom_id in pending:
+                results[custom_id].update({
+                    "status": "failed",
+                    "error_message": f"No batch result (batch status: {batch.status})"
+                })
+    finally:
+        try:
+            os.remove(batch_input_path)
+        except OSError:
+            pass
     
+    end_time = datetime.now()
+    for result in results.values():
+        result["end_time"] = end_time.isoformat()
+    
+    return list(results.values())
+
+
+if __name__ == "__main__":
     # --- Determine Configuration --- 
     # Precedence: CLI > Environment Variables > Defaults
     
@@ -780,6 +2203,7 @@ if __name__ == "__main__":
     openai_model = OPENAI_MODEL_DEFAULT
     use_live_rates = USE_LIVE_EXCHANGE_RATES_DEFAULT
     fallback_rate = FALLBACK_EXCHANGE_RATE_DEFAULT
+    concurrency = OPENAI_CONCURRENCY_DEFAULT
     input_folder = DEFAULT_INPUT_FOLDER
     output_folder = DEFAULT_OUTPUT_FOLDER
     
@@ -787,6 +2211,8 @@ if __name__ == "__main__":
     openai_model = os.getenv("OPENAI_MODEL", openai_model)
     use_live_rates = os.getenv("USE_LIVE_EXCHANGE_RATES", str(use_live_rates)).lower() == "true"
     fallback_rate = float(os.getenv("FALLBACK_EXCHANGE_RATE", fallback_rate))
+    concurrency = int(os.getenv("OPENAI_CONCURRENCY", concurrency))
+    cache_dir = Path(os.getenv("INVOICE_CACHE_DIR", DEFAULT_CACHE_DIR)) if USE_EXTRACTION_CACHE else None
     
     # Command Line Arguments Parser
     parser = argparse.ArgumentParser(description="Process invoice PDFs using OpenAI")
@@ -794,13 +2220,21 @@ if __name__ == "__main__":
     parser.add_argument("--output", "-o", type=Path, help=f"Output folder (default: {DEFAULT_OUTPUT_FOLDER})")
     parser.add_argument("--live-rates", action="store_true", help="Use live exchange rates (overrides environment variable)")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument("--concurrency", "-c", type=int,
+                       help=f"Maximum concurrent OpenAI requests (default: {OPENAI_CONCURRENCY_DEFAULT})")
     
     # Advanced features
-    parser.add_argument("--mode", choices=["process", "validate", "dry-run"], default="process",
-                       help="Processing mode: process (normal), validate (check files only), dry-run (extract but don't save)")
+    parser.add_argument("--mode", choices=["process", "validate", "dry-run", "batch"], default="process",
+                       help="Processing mode: process (normal), validate (check files only), dry-run (extract but don't save), "
+                            "batch (process through the OpenAI Batch API at reduced cost; may take up to 24h)")
     parser.add_argument("--export-csv", type=Path, help="Export results to CSV file")
     parser.add_argument("--export-json", type=Path, help="Export results to JSON file")
     parser.add_argument("--stats", action="store_true", help="Show processing statistics")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Disable the on-disk cache of extraction results")
+    parser.add_argument("--copy-mode", choices=COPY_MODES,
+                       help=f"How processed invoices are placed in the output folder "
+                            f"(overrides INVOICE_COPY_MODE; default: {COPY_MODE_DEFAULT})")
     
     args = parser.parse_args()
     
@@ -811,6 +2245,14 @@ if __name__ == "__main__":
         output_folder = args.output
     if args.live_rates:
         use_live_rates = True # CLI flag takes highest precedence
+    if args.concurrency:
+        concurrency = args.concurrency
+    if args.no_cache:
+        cache_dir = None
+    if args.copy_mode:
+        # Read by _copy_invoice for each saved file
+        os.environ["INVOICE_COPY_MODE"] = args.copy_mode
+    cache = ExtractionCache(cache_dir) if cache_dir is not None else None
         
     # Set debug level AFTER parsing args
     if args.debug:
@@ -827,11 +2269,26 @@ if __name__ == "__main__":
     logger.info(f"OpenAI Model: {openai_model}")
     logger.info(f"Use Live Exchange Rates: {use_live_rates}")
     logger.info(f"Fallback Exchange Rate: {fallback_rate}")
+    logger.info(f"OpenAI Concurrency: {concurrency}")
+    logger.info(f"Extraction Cache: {cache_dir if cache_dir is not None else 'disabled'}")
+    logger.info(f"Copy Mode: {os.getenv('INVOICE_COPY_MODE', COPY_MODE_DEFAULT)}")
     logger.info(f"Export CSV: {args.export_csv}")
     logger.info(f"Export JSON: {args.export_json}")
     logger.info(f"Show Statistics: {args.stats}")
     logger.info(f"-----------------------------")
 
+    # Plain processing doesn't need per-file results: use the original main function
+    # for backward compatibility (and so files aren't processed twice)
+    if args.mode == "process" and not args.export_csv and not args.export_json and not args.stats:
+        main(input_folder=input_folder, 
+             output_folder=output_folder, 
+             openai_model=openai_model, 
+             use_live_rates=use_live_rates, 
+             fallback_rate=fallback_rate,
+             concurrency=concurrency,
+             cache=cache)
+        sys.exit(0)
+    
     # Process batch with statistics
     results, stats = process_batch_with_stats(
         input_folder=input_folder,
@@ -839,7 +2296,9 @@ if __name__ == "__main__":
         openai_model=openai_model,
         use_live_rates=use_live_rates,
         fallback_rate=fallback_rate,
-        mode=args.mode
+        mode=args.mode,
+        concurrency=concurrency,
+        cache=cache
     )
     
     # Export results if requested
@@ -885,7 +2344,10 @@ if __name__ == "__main__":
             logger.info(f"Average Time per File: {performance.get('average_time_per_file', 0):.1f} seconds")
             logger.info(f"Fastest File: {performance.get('fastest_file', 0):.1f} seconds")
             logger.info(f"Slowest File: {performance.get('slowest_file', 0):.1f} seconds")
-        
+
+        if cache is not None:
+            logger.info(f"Extraction Cache Hits: {cache.hits} (misses: {cache.misses})")
+
         # Error analysis
         errors = stats.get("errors", {})
         if errors:
@@ -894,12 +2356,3 @@ if __name__ == "__main__":
                 logger.info(f"{error}: {count} occurrences")
         
         logger.info("-----------------------------")
-    
-    # If not using new batch processor, fall back to original main function
-    if args.mode == "process" and not args.export_csv and not args.export_json and not args.stats:
-        # Use original main function for backward compatibility
-        main(input_folder=input_folder, 
-             output_folder=output_folder, 
-             openai_model=openai_model, 
-             use_live_rates=use_live_rates, 
-             fallback_rate=fallback_rate) 
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+PDF Worker for Invoice Processor
+
+This module holds the code run by the processes that extract text from large
+PDFs in parallel. It has no import-time side effects, so worker processes
+started with spawn or forkserver don't set up logging, the OpenAI client or
+the provider mapper of the main processor when they import it.
+"""
+
+import io
+from typing import List, Tuple
+
+import PyPDF2  # type: ignore # Using type_ignore as stubs aren't available
+
+
+def extract_page_range(job: Tuple[bytes, int, int]) -> List[str]:
+    """
+    Extract the text of a range of pages (runs in a worker process).
+
+    Args:
+        job: Tuple of (PDF bytes, first page index, end page index)
+
+    Returns:
+        List of page texts, in page order
+    """
+    pdf_bytes, start, stop = job
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
@@ -1,14 +1,49 @@
+import importlib.util
+import io
 import os
-import openai
-import PyPDF2
 import re # Import regex module
-from forex_python.converter import CurrencyRates  # type: ignore
-from openai import OpenAI
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
+import logging.handlers
 from datetime import datetime
+import json
 import shutil
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Faster C-based PDF text extractors, used in this order when installed
+try:
+    import fitz  # type: ignore
+    USE_PYMUPDF = True
+except ImportError:
+    USE_PYMUPDF = False
+try:
+    import pypdfium2 as pdfium  # type: ignore
+    USE_PYPDFIUM2 = True
+except ImportError:
+    USE_PYPDFIUM2 = False
+
+# orjson parses JSON answers faster than the json module; use it when it is installed
+try:
+    import orjson  # type: ignore
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+# tiktoken counts tokens exactly; without it, text length is estimated from characters
+try:
+    import tiktoken  # type: ignore
+    USE_TIKTOKEN = True
+except ImportError:
+    USE_TIKTOKEN = False
+
+# fcntl (POSIX only) is needed for copy-on-write clones of invoices
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
 
 # Import provider mapping functionality
 try:
@@ -18,13 +53,29 @@ except ImportError:
     USE_PROVIDER_MAPPING = False
     print("Provider mapping module not found. Will always use OpenAI for provider identification.")
 
+# Import caching of PDF text and extraction results
+try:
+    from extraction_cache import (DEFAULT_CACHE_DIR, DEFAULT_TEXT_CACHE_DIR,
+                                  ExtractionCache, PdfTextCache, cache_key)
+    USE_EXTRACTION_CACHE = True
+except ImportError:
+    USE_EXTRACTION_CACHE = False
+    print("Extraction cache module not found. Every run will parse PDFs and query OpenAI.")
+
 # Configure logging
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Buffer up to 1000 records before writing the log file (errors are written right
+# away), so worker threads don't contend on a write per record; logging's exit
+# hook flushes what is left in the buffer
+_log_file_handler = logging.FileHandler("invoice_processor.log")
+_log_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
         logging.StreamHandler(),
-        logging.FileHandler("invoice_processor.log")
+        logging.handlers.MemoryHandler(1000, flushLevel=logging.ERROR, target=_log_file_handler)
     ]
 )
 logger = logging.getLogger("invoice_processor")
@@ -37,8 +88,27 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
 
-# Set up OpenAI API client
-client = OpenAI(api_key=api_key)
+# OpenAI API client, created on first use: importing openai is the slowest part of
+# startup, and a run served entirely from the caches never needs it
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    """Returns the shared OpenAI client, creating it on the first call."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import httpx
+            from openai import DefaultHttpxClient, OpenAI
+            # One kept-alive connection per worker thread, so workers never wait on the
+            # pool or pay for a new TLS handshake; HTTP/2 needs the optional h2 package
+            pool_size = max(1, int(os.getenv("INVOICE_WORKERS", INVOICE_WORKERS_DEFAULT)))
+            http_client = DefaultHttpxClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+            _client = OpenAI(api_key=api_key, http_client=http_client)
+        return _client
 
 # Define input and output folders
 input_folder = Path("input_invoices")
@@ -47,19 +117,103 @@ output_folder = Path("processed_invoices")
 # Create output folder if it doesn't exist
 output_folder.mkdir(exist_ok=True)
 
-# Initialize provider mapper if available
+# Model used for invoice extraction; it must support JSON mode and not be a reasoning
+# model, whose hidden reasoning would use up the small token budget below. Separate from
+# OPENAI_MODEL, which configures improved_invoice_processor.py
+OPENAI_MODEL = os.getenv("LEGACY_OPENAI_MODEL", "gpt-4o-mini")
+
+# Completion token budget per invoice (a JSON object of four short fields); batched
+# requests get this budget once per invoice
+MAX_COMPLETION_TOKENS = int(os.getenv("LEGACY_MAX_COMPLETION_TOKENS", 120))
+
+# Invoice text sent to OpenAI is cut to this many tokens, keeping the head
+# (provider, date) and the tail (totals)
+INVOICE_TEXT_MAX_TOKENS = 2000
+INVOICE_TEXT_HEAD_TOKENS = 1500
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+# System message shared by every extraction request
+SYSTEM_PROMPT = (
+    "You extract details from invoices. Return JSON with the keys provider, date, amount "
+    "and currency: provider is the service provider, date is the invoice date in "
+    "dd_MM_yyyy format, amount is the total amount in USD as a number and currency is 'USD'."
+)
+
+# Caches of PDF text and OpenAI results keyed by PDF content; set the directory
+# variables to an empty string to disable a cache
+pdf_text_cache = None
+extraction_cache = None
+if USE_EXTRACTION_CACHE:
+    _pdf_cache_dir = os.getenv("INVOICE_PDF_CACHE", str(DEFAULT_TEXT_CACHE_DIR))
+    if _pdf_cache_dir:
+        pdf_text_cache = PdfTextCache(Path(_pdf_cache_dir),
+                                      max_bytes=int(os.getenv("INVOICE_PDF_CACHE_MAX_BYTES", 0)) or None)
+    _extraction_cache_dir = os.getenv("INVOICE_CACHE_DIR", str(DEFAULT_CACHE_DIR))
+    if _extraction_cache_dir:
+        extraction_cache = ExtractionCache(Path(_extraction_cache_dir))
+
+# Number of invoices processed at the same time (each mostly waits on OpenAI)
+INVOICE_WORKERS_DEFAULT = 8
+
+# Number of invoices packed into a single OpenAI request
+INVOICE_BATCH_SIZE_DEFAULT = 5
+
+# How processed invoices are placed in the output folder: auto (hard link, then
+# reflink, then copy), link, reflink or copy
+COPY_MODE_DEFAULT = "auto"
+FICLONE = 0x40049409  # Linux ioctl cloning a whole file (linux/fs.h)
+
+# Maximum number of discovered PDF files waiting for a worker
+PDF_QUEUE_SIZE = 64
+
+# Initialize provider mapper if available; learned mappings are saved once at the end of main
+provider_mapper = None
 if USE_PROVIDER_MAPPING:
-    provider_mapper = ProviderMapper()
+    provider_mapper = ProviderMapper(autosave=False)
     logger.info(f"Initialized provider mapper with {len(provider_mapper.get_all_mappings())} mappings")
 
 # Function to extract text from PDF
-def extract_text_from_pdf(pdf_path):
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+def extract_text_from_pdf(pdf_path, pdf_bytes=None):
+    """Extracts the text of a PDF, reusing the cached text of identical files."""
+    if pdf_bytes is None:
+        pdf_bytes = Path(pdf_path).read_bytes()
+    if pdf_text_cache:
+        cached_text = pdf_text_cache.get(pdf_bytes)
+        if cached_text is not None:
+            return cached_text
+    
+    if USE_PYMUPDF:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            text = "".join(page.get_text("text") for page in doc)
+    elif USE_PYPDFIUM2:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            text = "".join(page.get_textpage().get_text_range() for page in pdf)
+        finally:
+            pdf.close()
+    else:
+        import PyPDF2 # Only needed without the faster extractors
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        text = "".join(page.extract_text() for page in reader.pages)
+    if pdf_text_cache:
+        pdf_text_cache.set(pdf_bytes, text)
+    return text
+
+def _cached_invoice_details(pdf_bytes, pdf_text):
+    """Looks up a previous extraction of the same PDF.
+    Returns (cache key, details), where details has the shape returned by
+    get_invoice_details or is None on a miss, and the key is None without a cache.
+    """
+    if not extraction_cache:
+        return None, None
+    key = cache_key(pdf_bytes, OPENAI_MODEL)
+    cached = extraction_cache.get(key)
+    if cached is None:
+        return key, None
+    provider, date_str, usd_amount = cached
+    logger.info(f"Using cached extraction for provider {provider}")
+    return key, (provider, date_str, usd_amount, convert_usd_to_brl(usd_amount),
+                 classify_document_type(pdf_text), False)
 
 def classify_document_type(text: str) -> str:
     """Classifies document as Invoice or Receipt based on keywords."""
@@ -74,6 +228,46 @@ def classify_document_type(text: str) -> str:
     # Default to Invoice if no specific receipt keywords found
     return "Invoice" 
 
+def _truncate_invoice_text(pdf_text):
+    """Cuts the invoice text to INVOICE_TEXT_MAX_TOKENS, keeping its head and tail."""
+    if USE_TIKTOKEN:
+        try:
+            encoding = tiktoken.encoding_for_model(OPENAI_MODEL)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        tokens = encoding.encode(pdf_text)
+        if len(tokens) <= INVOICE_TEXT_MAX_TOKENS:
+            return pdf_text
+        tail_tokens = INVOICE_TEXT_MAX_TOKENS - INVOICE_TEXT_HEAD_TOKENS
+        return (encoding.decode(tokens[:INVOICE_TEXT_HEAD_TOKENS]) + "\n...\n"
+                + encoding.decode(tokens[-tail_tokens:]))
+    
+    max_chars = INVOICE_TEXT_MAX_TOKENS * CHARS_PER_TOKEN_ESTIMATE
+    if len(pdf_text) <= max_chars:
+        return pdf_text
+    head_chars = INVOICE_TEXT_HEAD_TOKENS * CHARS_PER_TOKEN_ESTIMATE
+    return pdf_text[:head_chars] + "\n...\n" + pdf_text[-(max_chars - head_chars):]
+
+def _request_json(prompt, max_completion_tokens):
+    """Sends an extraction prompt in JSON mode and returns the decoded JSON object."""
+    response = _get_client().chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+        max_completion_tokens=max_completion_tokens
+    )
+    content = response.choices[0].message.content
+    if not content:
+        raise ValueError("Empty response from OpenAI")
+    # orjson.JSONDecodeError is a subclass of ValueError, like json's
+    answer = orjson.loads(content) if USE_ORJSON else json.loads(content)
+    if not isinstance(answer, dict):
+        raise ValueError("Invalid response format from OpenAI (expected a JSON object)")
+    return answer
+
 # Function to interact with OpenAI for extracting invoice details
 def get_invoice_details(pdf_text, provider_mapper=None):
     """Extracts invoice details, using provider mapping first if available.
@@ -98,61 +292,45 @@ def get_invoice_details(pdf_text, provider_mapper=None):
     logger.info(f"Document classified as: {doc_type}")
 
     # --- Call OpenAI --- 
-    # (Prompts remain the same, we just parse differently)
     if provider_from_mapping:
         prompt = (
-            f"I already know the service provider is '{provider_from_mapping}'.\n"
-            "Extract ONLY the following details from the invoice text and return them in a strict format of 3 elements separated by ' - ':\n"
-            "1. Date in dd_MM_yyyy format\n"
-            "2. Amount in USD (just the number)\n"
-            "3. 'USD'\n\n"
-            f"Text from invoice:\n{pdf_text}\n\n"
-            "Important: Respond ONLY with the 3 elements separated by ' - ' without any additional text."
+            f"I already know the service provider is '{provider_from_mapping}'; return it as provider.\n\n"
+            f"Text from invoice:\n{_truncate_invoice_text(pdf_text)}"
         )
     else:
-        # Standard prompt to extract all details
-        prompt = (
-            "Extract the following details from the invoice text and return them in a strict format of 4 elements separated by ' - ':\n"
-            "1. Service Provider\n"
-            "2. Date in dd_MM_yyyy format\n"
-            "3. Amount in USD (just the number)\n"
-            "4. 'USD'\n\n"
-            f"Text from invoice:\n{pdf_text}\n\n"
-            "Important: Respond ONLY with the 4 elements separated by ' - ' without any additional text."
-        )
-        
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        max_completion_tokens=100
-    )
+        prompt = f"Text from invoice:\n{_truncate_invoice_text(pdf_text)}"
     
-    # Parse the response
-    content = response.choices[0].message.content.strip()
+    answer = _request_json(prompt, MAX_COMPLETION_TOKENS)
+    provider, date_str, usd_amount, brl_amount = _parse_invoice_details(answer, pdf_text, provider_from_mapping, provider_mapper)
     
-    # Handle parsing based on whether we used provider mapping or not
-    if provider_from_mapping:
-        # Parse 3 elements (date, amount, currency)
-        details = content.split(" - ")
-        if len(details) != 3:
-            raise ValueError("Invalid response format from OpenAI (expected 3 elements)")
-        
-        date_str, usd_amount_str, currency = details
-        provider = provider_from_mapping
-    else:
-        # Parse 4 elements (provider, date, amount, currency)
-        details = content.split(" - ")
-        if len(details) != 4:
-            raise ValueError("Invalid response format from OpenAI (expected 4 elements)")
-        
-        provider, date_str, usd_amount_str, currency = details
-        
-        # Update provider mapping if available
-        if USE_PROVIDER_MAPPING:
-            provider_mapper.update_from_openai_result(pdf_text, provider)
+    # Return structured data
+    return provider, date_str, usd_amount, brl_amount, doc_type, openai_provider_id_used
+
+# Invoice dates as returned by OpenAI (dd_MM_yyyy); strptime("%d_%m_%Y") also takes one-digit days and months
+_DATE_RE = re.compile(r"(\d{1,2})_(\d{1,2})_(\d{4})")
+
+def _parse_invoice_details(answer, pdf_text, provider_from_mapping=None, provider_mapper=None):
+    """Parses one JSON answer into (provider, date_str, usd_amount, brl_amount)."""
+    try:
+        date_str = str(answer["date"]).strip()
+        usd_amount_str = str(answer["amount"])
+        # Keep the provider we already know from the mapping
+        provider = provider_from_mapping or str(answer["provider"]).strip()
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid response format from OpenAI (missing {str(e)})")
+    if not provider:
+        raise ValueError("Invalid response format from OpenAI (empty provider)")
+    
+    # Update provider mapping if available
+    if not provider_from_mapping and USE_PROVIDER_MAPPING and provider_mapper:
+        provider_mapper.update_from_openai_result(pdf_text, provider)
     
-    # Convert date string to datetime object
-    date = datetime.strptime(date_str, "%d_%m_%Y")
+    # Validate the date; building the date directly is much cheaper than strptime
+    date_match = _DATE_RE.fullmatch(date_str)
+    if not date_match:
+        raise ValueError(f"time data {date_str!r} does not match format '%d_%m_%Y'")
+    day, month, year = map(int, date_match.groups())
+    datetime(year, month, day) # Raises ValueError for impossible dates such as 31_02_2024
     
     # Convert USD amount to float
     usd_amount = float(usd_amount_str.replace(',', '.')) # Handle comma as decimal separator
@@ -160,85 +338,231 @@ def get_invoice_details(pdf_text, provider_mapper=None):
     # Get BRL amount
     brl_amount = convert_usd_to_brl(usd_amount)
     
-    # Return structured data
-    return provider, date_str, usd_amount, brl_amount, doc_type, openai_provider_id_used
+    return provider, date_str, usd_amount, brl_amount
+
+def get_invoice_details_batch(pdf_texts, provider_mapper=None):
+    """Extracts details of several invoices with a single OpenAI request.
+    Invoices whose provider is known from the mapping keep that provider.
+    Returns a list aligned with pdf_texts holding, per invoice, either the same tuple
+    as get_invoice_details or the exception that prevented parsing its answer.
+    """
+    if provider_mapper:
+        providers_from_mapping = provider_mapper.identify_providers_batch(pdf_texts)
+    else:
+        providers_from_mapping = [None] * len(pdf_texts)
+    sections = []
+    for number, (pdf_text, provider_from_mapping) in enumerate(zip(pdf_texts, providers_from_mapping), start=1):
+        if provider_from_mapping:
+            logger.info(f"Invoice {number}: provider identified from mapping: {provider_from_mapping}")
+            header = f"### INVOICE {number} (service provider already known: '{provider_from_mapping}')"
+        else:
+            header = f"### INVOICE {number}"
+        sections.append(f"{header}\n{_truncate_invoice_text(pdf_text)}")
+    
+    prompt = (
+        f"Below are {len(pdf_texts)} invoices, each starting with a '### INVOICE <number>' header.\n"
+        "Return a JSON object with an 'invoices' list holding one object per invoice, with the "
+        "key 'invoice' set to its number plus the keys provider, date, amount and currency.\n\n"
+        + "\n\n".join(sections)
+    )
+    answer = _request_json(prompt, MAX_COMPLETION_TOKENS * len(pdf_texts))
+    
+    # Map each answer back to its invoice by number
+    answers = {}
+    invoices = answer.get("invoices")
+    for invoice_answer in invoices if isinstance(invoices, list) else []:
+        if isinstance(invoice_answer, dict):
+            try:
+                answers.setdefault(int(invoice_answer.get("invoice")), invoice_answer)
+            except (TypeError, ValueError):
+                continue
+    
+    results = []
+    for number, (pdf_text, provider_from_mapping) in enumerate(zip(pdf_texts, providers_from_mapping), start=1):
+        try:
+            if number not in answers:
+                raise ValueError(f"No answer for invoice {number} in batched OpenAI response")
+            provider, date_str, usd_amount, brl_amount = _parse_invoice_details(
+                answers[number], pdf_text, provider_from_mapping, provider_mapper)
+            results.append((provider, date_str, usd_amount, brl_amount,
+                            classify_document_type(pdf_text), provider_from_mapping is None))
+        except ValueError as e:
+            results.append(e)
+    return results
 
 # Function to convert USD to BRL using forex-python
 def convert_usd_to_brl(usd_amount: float) -> float:
     conversion_rate = float(5.74)
     return round(usd_amount * conversion_rate, 2)
 
+# Output filename: provider - doc type - date - USD amount - BRL amount
+OUTPUT_FILENAME_TEMPLATE = "{} - {} - {} - USD {:.2f} - BRL {:.2f}.pdf"
+
+# Characters replaced with a hyphen or removed from filenames (after "c/o" -> "-")
+_SANITIZE_TABLE = str.maketrans({
+    '/': '-',    # Replace forward slashes
+    '\\': '-',   # Replace backslashes
+    ':': '-',    # Replace colons
+    '*': None,   # Remove asterisks
+    '?': None,   # Remove question marks
+    '"': None,   # Remove quotes
+    '<': None,   # Remove angle brackets
+    '>': None,   # Remove angle brackets
+    '|': '-',    # Replace pipes with hyphens
+})
+
 def sanitize_filename(filename):
-    # Replace problematic characters/phrases
-    replacements = {
-        'c/o': '-',  # Replace "c/o" with a hyphen
-        '/': '-',    # Replace forward slashes
-        '\\': '-',   # Replace backslashes
-        ':': '-',    # Replace colons
-        '*': '',     # Remove asterisks
-        '?': '',     # Remove question marks
-        '"': '',     # Remove quotes
-        '<': '',     # Remove angle brackets
-        '>': '',     # Remove angle brackets
-        '|': '-',    # Replace pipes with hyphens
-    }
-    
-    result = filename
-    for old, new in replacements.items():
-        result = result.replace(old, new)
-    
-    return result.strip()
+    # "c/o" is the only multi-character replacement; the rest is one translate pass
+    return filename.replace('c/o', '-').translate(_SANITIZE_TABLE).strip()
 
-def process_file(filepath, provider_mapper=None):
+def process_file(filepath, provider_mapper=None, output_folder=output_folder):
     """Processes a single PDF file, returning success and if OpenAI was used for provider ID."""
     try:
         # Extract text from PDF
-        pdf_text = extract_text_from_pdf(filepath)
-        
-        # Extract invoice details
-        provider, date_str, usd_amount, brl_amount, doc_type, openai_id_used = get_invoice_details(pdf_text, provider_mapper)
+        pdf_bytes = filepath.read_bytes()
+        pdf_text = extract_text_from_pdf(filepath, pdf_bytes)
         
-        # Construct details string for filename
-        details_for_filename = f"{provider} - {doc_type} - {date_str} - USD {usd_amount:.2f} - BRL {brl_amount:.2f}"
-
-        # Sanitize the new filename to remove/replace invalid characters
-        new_filename = sanitize_filename(f"{details_for_filename}.pdf")
-        new_filepath = output_folder / new_filename
-        
-        # Ensure we don't try to rename if the file already exists
-        if new_filepath.exists():
-            print(f"Warning: Output file already exists: {new_filepath}")
-            # Append a number to the filename to make it unique
-            base, ext = os.path.splitext(new_filename)
-            counter = 1
-            while True:
-                new_filename = f"{base}_{counter}{ext}"
-                new_filepath = output_folder / new_filename
-                if not new_filepath.exists():
-                    break
-                counter += 1
-            
-        # Copy the file to the output folder
-        shutil.copy2(filepath, new_filepath)
-        print(f"Processed: {filepath.name} -> {new_filename}")
-        return True, openai_id_used
+        # Extract invoice details, unless this exact PDF was processed before
+        key, details = _cached_invoice_details(pdf_bytes, pdf_text)
+        if details is None:
+            details = get_invoice_details(pdf_text, provider_mapper)
+            if key:
+                extraction_cache.set(key, *details[:3])
+        _save_processed_file(filepath, details, output_folder)
+        return True, details[5]
     except Exception as e:
         print(f"Error processing {filepath}")
         print(f"Details: {str(e)}")
         return False, False # Return False for success, False for OpenAI use on error
 
+def _reserve_output_file(filepath, new_filepath):
+    """Atomically claims an output name, returning True if the invoice was hard-linked to it.
+    Otherwise an empty placeholder is created for the copy; raises FileExistsError if taken.
+    """
+    copy_mode = os.getenv("INVOICE_COPY_MODE", COPY_MODE_DEFAULT).lower()
+    if copy_mode in ("auto", "link"):
+        try:
+            os.link(filepath, new_filepath)
+            return True
+        except FileExistsError:
+            raise
+        except OSError:
+            pass # Different filesystem, or hard links not supported
+    os.close(os.open(new_filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+    return False
+
+def _copy_invoice(filepath, new_filepath):
+    """Copies an invoice over its reserved output placeholder, cloning it when possible."""
+    copy_mode = os.getenv("INVOICE_COPY_MODE", COPY_MODE_DEFAULT).lower()
+    if copy_mode in ("auto", "reflink") and fcntl is not None:
+        try:
+            with open(filepath, 'rb') as src, open(new_filepath, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(filepath, new_filepath)
+            return
+        except OSError:
+            pass # Not a copy-on-write filesystem; copy2 overwrites the output
+    shutil.copy2(filepath, new_filepath)
+
+def _save_processed_file(filepath, details, output_folder=output_folder):
+    """Copies a processed PDF to the output folder under a name built from its details."""
+    provider, date_str, usd_amount, brl_amount, doc_type, _ = details
+    # Sanitize the new filename to remove/replace invalid characters
+    new_filename = sanitize_filename(OUTPUT_FILENAME_TEMPLATE.format(provider, doc_type, date_str, usd_amount, brl_amount))
+    new_filepath = output_folder / new_filename
+
+    # Ensure we don't overwrite an existing file; claiming the name is atomic
+    try:
+        linked = _reserve_output_file(filepath, new_filepath)
+    except FileExistsError:
+        print(f"Warning: Output file already exists: {new_filepath}")
+        # Append a number to the filename to make it unique
+        base, ext = os.path.splitext(new_filename)
+        counter = 1
+        while True:
+            new_filename = f"{base}_{counter}{ext}"
+            new_filepath = output_folder / new_filename
+            try:
+                linked = _reserve_output_file(filepath, new_filepath)
+                break
+            except FileExistsError:
+                counter += 1
+
+    if not linked:
+        # Other workers copy their invoices at the same time
+        try:
+            _copy_invoice(filepath, new_filepath)
+        except BaseException:
+            new_filepath.unlink(missing_ok=True)
+            raise
+    print(f"Processed: {filepath.name} -> {new_filename}")
+
+def process_files_batch(filepaths, provider_mapper=None, output_folder=output_folder):
+    """Processes several PDF files with one OpenAI request.
+    Returns a list of (filepath, success, openai_used); files whose batched answer
+    can't be used are retried one by one with process_file.
+    """
+    if len(filepaths) == 1:
+        return [(filepaths[0], *process_file(filepaths[0], provider_mapper, output_folder))]
+    
+    results = []
+    extracted = []
+    cached = []
+    for filepath in filepaths:
+        try:
+            pdf_bytes = filepath.read_bytes()
+            pdf_text = extract_text_from_pdf(filepath, pdf_bytes)
+            key, details = _cached_invoice_details(pdf_bytes, pdf_text)
+            if details is None:
+                extracted.append((filepath, key, pdf_text))
+            else:
+                cached.append((filepath, details))
+        except Exception as e:
+            print(f"Error processing {filepath}")
+            print(f"Details: {str(e)}")
+            results.append((filepath, False, False))
+    
+    batch_details = []
+    if extracted:
+        # Identical invoice texts are only sent once; each file gets the shared answer
+        unique_texts = list(dict.fromkeys(pdf_text for _, _, pdf_text in extracted))
+        try:
+            unique_details = get_invoice_details_batch(unique_texts, provider_mapper)
+        except Exception as e:
+            logger.warning(f"Batched OpenAI request failed, processing {len(extracted)} files one by one: {str(e)}")
+            unique_details = [e] * len(unique_texts)
+        details_by_text = dict(zip(unique_texts, unique_details))
+        batch_details = [details_by_text[pdf_text] for _, _, pdf_text in extracted]
+    
+    to_save = cached
+    for (filepath, key, _), details in zip(extracted, batch_details):
+        if isinstance(details, Exception):
+            logger.warning(f"Retrying {filepath.name} on its own: {str(details)}")
+            results.append((filepath, *process_file(filepath, provider_mapper, output_folder)))
+            continue
+        if key:
+            extraction_cache.set(key, *details[:3])
+        to_save.append((filepath, details))
+    
+    for filepath, details in to_save:
+        try:
+            _save_processed_file(filepath, details, output_folder)
+            results.append((filepath, True, details[5]))
+        except Exception as e:
+            print(f"Error processing {filepath}")
+            print(f"Details: {str(e)}")
+            results.append((filepath, False, False))
+    return results
+
 def main():
     # Create a list to track failed files
     failed_files = []
     openai_id_calls = 0
     processed_count = 0
     
-    # Initialize provider mapper if available
-    mapper_instance = None
-    if USE_PROVIDER_MAPPING:
-        mapper_instance = ProviderMapper()
-        logger.info(f"Initialized provider mapper with {len(mapper_instance.get_all_mappings())} mappings")
-    else:
+    # Reuse the provider mapper loaded at startup
+    mapper_instance = provider_mapper
+    if not mapper_instance:
         logger.warning("Provider mapping disabled.")
     
     # Ensure input folder exists
@@ -248,25 +572,62 @@ def main():
         print("Please place PDF invoices in this folder and run the script again.")
         return
     
-    # Count PDF files in the input folder
-    pdf_files = list(input_folder.glob("*.pdf"))
-    if not pdf_files:
-        print(f"No PDF files found in {input_folder}. Please add some PDF invoices and try again.")
-        return
+    workers = max(1, int(os.getenv("INVOICE_WORKERS", INVOICE_WORKERS_DEFAULT)))
+    batch_size = max(1, int(os.getenv("INVOICE_BATCH_SIZE", INVOICE_BATCH_SIZE_DEFAULT)))
+    print(f"Processing files in {input_folder} with {workers} workers, {batch_size} per OpenAI request...")
     
-    print(f"Found {len(pdf_files)} PDF files in {input_folder}")
-    print(f"Processing files...")
+    # Workers start on the first files while the folder is still being scanned
+    pdf_queue = queue.Queue(maxsize=PDF_QUEUE_SIZE)
     
-    # Process each PDF file
-    for filepath in pdf_files:
-        print(f"Processing file: {filepath.name}")
-        success, openai_used = process_file(filepath, mapper_instance)
-        if success:
-            processed_count += 1
-            if openai_used:
-                openai_id_calls += 1
-        else:
-            failed_files.append(filepath.name)
+    def produce_pdf_files():
+        try:
+            with os.scandir(input_folder) as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith(".pdf") and entry.is_file():
+                        pdf_queue.put(Path(entry.path))
+        finally:
+            # One end marker per worker
+            for _ in range(workers):
+                pdf_queue.put(None)
+    
+    def consume_pdf_files():
+        worker_results = []
+        finished = False
+        while not finished:
+            batch = []
+            while len(batch) < batch_size:
+                filepath = pdf_queue.get()
+                if filepath is None:
+                    finished = True
+                    break
+                print(f"Processing file: {filepath.name}")
+                batch.append(filepath)
+            if batch:
+                worker_results.extend(process_files_batch(batch, mapper_instance, output_folder))
+        return worker_results
+    
+    # Process batches of PDF files in parallel, collecting results as workers finish
+    with ThreadPoolExecutor(max_workers=workers + 1) as executor:
+        producer = executor.submit(produce_pdf_files)
+        consumers = [executor.submit(consume_pdf_files) for _ in range(workers)]
+        
+        for future in as_completed(consumers):
+            for filepath, success, openai_used in future.result():
+                if success:
+                    processed_count += 1
+                    if openai_used:
+                        openai_id_calls += 1
+                else:
+                    failed_files.append(filepath.name)
+        producer.result()
+    
+    # Write the mappings learned during the run
+    if mapper_instance:
+        mapper_instance.save()
+    
+    if processed_count == 0 and not failed_files:
+        print(f"No PDF files found in {input_folder}. Please add some PDF invoices and try again.")
+        return
     
     # Summary of failed files
     if failed_files:
@@ -7,13 +7,48 @@ and maintain a mapping of known providers to standardized names from a JSON file
 
 import re
 import json
+import array
+import functools
+import hashlib
+from collections import OrderedDict
 import logging
 from pathlib import Path
-from typing import Dict, Optional, List, Tuple, Any
+from typing import Dict, Iterator, Optional, List, Sequence, Set, Tuple, Any
 import os
-import tempfile
+import itertools
 import shutil
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# orjson parses and serializes much faster than the json module; use it when it is installed
+try:
+    import orjson  # type: ignore
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+def _utc_iso() -> str:
+    """Return the current UTC time in ISO 8601 format with a 'Z' suffix."""
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds').replace('+00:00', 'Z')
+
+def _json_loads(data: bytes) -> Any:
+    """Parse JSON from raw bytes, with orjson when available."""
+    return orjson.loads(data) if USE_ORJSON else json.loads(data)
+
+def _json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes (indented for the mapping file), with orjson when available."""
+    if USE_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, indent=4 if indent else None).encode('utf-8')
+
+# Hyperscan matches all patterns in one linear-time pass, immune to catastrophic
+# backtracking; use it when it is installed and supports every pattern
+try:
+    import hyperscan  # type: ignore
+    USE_HYPERSCAN = True
+except ImportError:
+    USE_HYPERSCAN = False
 
 # Configure logging
 logger = logging.getLogger("invoice_processor")
@@ -21,23 +56,236 @@ logger = logging.getLogger("invoice_processor")
 # Default path for provider mapping file
 DEFAULT_MAPPING_FILE = Path("provider_mappings.json")
 
+# Provider names almost always appear in the invoice header, so this many leading
+# characters are searched first and the rest of the text only on a miss
+HEADER_SCAN_CHARS = 4096
+
+# Number of recent texts whose identification result is remembered
+IDENTIFY_CACHE_SIZE = 4096
+
+# The journal of deferred changes is merged into the mapping file once it grows
+# past this many times the file's size, so each change costs amortized O(1) writes
+JOURNAL_COMPACT_RATIO = 2
+
+# New mapping files only differ in their timestamp, so the default content is
+# serialized once and the timestamp spliced in when a file is created
+_DEFAULT_TIMESTAMP_PLACEHOLDER = "__last_updated__"
+_DEFAULT_MAPPING_FILE_TEMPLATE = _json_dumps({
+    "version": "1.0.0",
+    "last_updated": _DEFAULT_TIMESTAMP_PLACEHOLDER,
+    "schema": {
+        "description": "Provider mapping configuration file",
+        "required_fields": ["pattern", "provider", "confidence", "last_used"],
+        "pattern_format": "regex",
+        "confidence_range": [0, 1]
+    },
+    "mappings": [] # Start with no default mappings, let them be learned or added manually
+}, indent=True)
+
+# Numbered backreferences or group conditionals (not preceded by an escaped backslash);
+# these would point at the wrong group once a pattern is wrapped in the fused alternation
+_NUMBERED_GROUP_REF_RE = re.compile(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\(\d)')
+
+# Escapes such as \S or \D and (?...) constructs change meaning when lowercased
+_CASE_SENSITIVE_SYNTAX_RE = re.compile(r'\\[A-Za-z]|\(\?')
+
+# End anchors, word boundaries and lookaheads, which can match spuriously at the end
+# of the header pass because they see the cut instead of the text after it
+_END_SENSITIVE_RE = re.compile(r'\$|\\[bBzZ]|\(\?[=!]')
+
+# Words of an invoice text considered as partial patterns when learning
+_WORD_RE = re.compile(r'\S+')
+
+# Compiled mapping patterns shared by all mappers of the process; re's own cache only
+# holds 512 patterns, fewer than a mapping file can reach, counted with the fused ones
+COMPILE_CACHE_SIZE = 4096
+_compile_cache: "OrderedDict[Tuple[str, int], re.Pattern]" = OrderedDict()
+_compile_cache_lock = threading.Lock()
+
+def _cached_compile(pattern: str, flags: int = 0) -> re.Pattern:
+    """Compile a pattern, reusing the result of an earlier identical compilation."""
+    key = (pattern, flags)
+    with _compile_cache_lock:
+        regex = _compile_cache.get(key)
+        if regex is not None:
+            _compile_cache.move_to_end(key)
+            return regex
+    regex = re.compile(pattern, flags) # Outside the lock; raises re.error for invalid patterns
+    with _compile_cache_lock:
+        _compile_cache[key] = regex
+        if len(_compile_cache) > COMPILE_CACHE_SIZE:
+            _compile_cache.popitem(last=False)
+    return regex
+
+# Characters with a special meaning in patterns, outside of escapes
+_REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+def _required_literal(pattern: str) -> str:
+    """
+    Return a literal every match of the pattern starts with ("" if there is none).
+    
+    Only the plain text at the start of the pattern is used, stopping at the first
+    special character, and patterns with any alternation are skipped, so the
+    literal is always required.
+    """
+    if "|" in pattern:
+        return ""
+    literal = []
+    index = 1 if pattern.startswith("^") else 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            # Escaped punctuation is literal; letter and digit escapes are classes or references
+            if index + 1 >= len(pattern) or pattern[index + 1].isalnum():
+                break
+            char, step = pattern[index + 1], 2
+        elif char in _REGEX_SPECIAL_CHARS:
+            break
+        else:
+            step = 1
+        following = pattern[index + step:index + step + 1]
+        if following and following in "*?{":
+            break # The character is optional or repeated a variable number of times
+        literal.append(char)
+        if following == "+":
+            break
+        index += step
+    return "".join(literal)
+
+# Numbers the temporary files of saves; with the process id this keeps their names
+# unique without tempfile's random name generation
+_save_counter = itertools.count()
+
+# Learned patterns are escaped provider names, and most invoices share a few providers
+_escape_provider = functools.lru_cache(maxsize=1024)(re.escape)
+
+def _fold_pattern(pattern: str) -> Optional[str]:
+    """Return the casefolded pattern, or None if it can't be casefolded safely."""
+    if _CASE_SENSITIVE_SYNTAX_RE.search(pattern):
+        return None
+    folded = pattern.casefold()
+    try:
+        _cached_compile(folded)
+    except re.error:
+        # Folding can break a valid pattern, e.g. [Z-a] becomes the bad range [z-a]
+        return None
+    return folded
+
+class ProviderMapping:
+    """A single provider mapping; slots keep thousands of learned mappings compact."""
+    
+    __slots__ = ("pattern", "provider", "confidence", "last_used", "source", "extra", "key_order")
+    
+    # Fields stored as attributes; any other keys of a mapping go to extra
+    FIELDS = ("pattern", "provider", "confidence", "last_used", "source")
+    
+    def __init__(self, pattern: Any, provider: Any, confidence: Optional[float] = None,
+                 last_used: Optional[str] = None, source: Optional[str] = None,
+                 extra: Optional[Dict[str, Any]] = None, key_order: Optional[Tuple[str, ...]] = None):
+        self.pattern = pattern
+        self.provider = provider
+        self.confidence = confidence
+        self.last_used = last_used
+        self.source = source
+        # Keys such as "_comment" or "examples", kept so saving doesn't drop them
+        self.extra = extra
+        # Keys of the JSON object the mapping was loaded from, so saving writes hand-edited
+        # entries back as they were; None for new mappings, which have every field
+        self.key_order = key_order
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProviderMapping":
+        """Create a mapping from its JSON object."""
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS} or None
+        return cls(data.get("pattern"), data.get("provider"), data.get("confidence"),
+                   data.get("last_used"), data.get("source"), extra, tuple(data))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the mapping as a JSON object, with its keys in their original order."""
+        extra = self.extra or {}
+        data = {}
+        for key in (self.FIELDS if self.key_order is None else self.key_order):
+            data[key] = getattr(self, key) if key in self.FIELDS else extra.get(key)
+        # Fields set after loading that the original object didn't have
+        for key in self.FIELDS:
+            if key not in data and getattr(self, key) is not None:
+                data[key] = getattr(self, key)
+        for key, value in extra.items():
+            data.setdefault(key, value)
+        return data
+
 class ProviderMapper:
     """A class to handle provider name identification and standardization using a JSON file."""
     
-    def __init__(self, mapping_file: Path = DEFAULT_MAPPING_FILE):
+    def __init__(self, mapping_file: Path = DEFAULT_MAPPING_FILE, autosave: bool = True,
+                 keep_backup: bool = True):
         """
         Initialize the ProviderMapper by loading mappings from the specified JSON file.
 
         Args:
             mapping_file: Path to the JSON file containing provider mappings.
+            autosave: Save the file after every change. When False, changes are
+                appended to a journal next to the file and only merged into it by
+                save(), e.g. once at the end of a run.
+            keep_backup: Keep the previous version of the file as a .bak file on
+                every save, for restore_from_backup().
         """
         self.mapping_file = mapping_file
+        self.journal_file = mapping_file.with_suffix(mapping_file.suffix + ".journal")
+        # Saves write a temporary file next to the mapping file
+        self._save_dir = mapping_file.parent
+        self.autosave = autosave
+        self.keep_backup = keep_backup
+        # Whether there are changes that haven't been written to the file yet
+        self._dirty = False
+        # Nesting depth of batch() blocks, which defer autosaves until they exit
+        self._suppress_save = 0
+        # Sizes in bytes of the mapping file as last loaded or saved, and of the journal
+        self._compacted_size = 0
+        self._journal_size = 0
         self.mappings_data: Dict[str, Any] = {}
-        self.provider_mappings: List[Dict[str, Any]] = []
+        self.provider_mappings: List[ProviderMapping] = []
+        # (pattern, provider) of every mapping, for constant-time duplicate checks
+        self._mapping_keys: Set[Tuple[Any, Any]] = set()
         self.compiled_patterns: Dict[re.Pattern, str] = {}
+        # Mapping pattern string -> its compiled regex, so removals don't recompile
+        self._compiled_by_source: Dict[str, re.Pattern] = {}
+        # All patterns fused into one alternation, so text without any known provider
+        # is rejected in a single scan (None when the patterns can't be fused)
+        self._fused_pattern: Optional[re.Pattern] = None
+        # Patterns in matching order as parallel arrays, with a hit counter per pattern
+        self._patterns: List[re.Pattern] = []
+        self._providers: List[str] = []
+        self._hit_counts = array.array('Q')
+        # When every pattern can be casefolded, they are compiled casefolded without
+        # re.IGNORECASE and searched against the text casefolded once per call
+        self._fold_text = False
+        # Fused group number (match.lastindex) -> position in _patterns
+        self._fused_group_order: Dict[int, int] = {}
+        # Positions in _patterns of the patterns in / left out of the alternation
+        self._fused_indices: List[int] = []
+        self._unfused_indices: List[int] = []
+        # Position of a pattern tried on its own -> literal it requires in the casefolded
+        # text, checked with a plain substring search before running the regex
+        self._unfused_literals: Dict[int, str] = {}
+        # Positions in _patterns of the patterns whose header matches are checked
+        # against the full text before they are accepted
+        self._end_sensitive: Set[int] = set()
+        # Hyperscan database of all patterns (ids are positions in _patterns), if available
+        self._hyperscan_db: Optional[Any] = None
+        # Digest of recently identified texts -> position of the matching pattern (or None);
+        # cleared whenever the patterns change
+        self._identify_cache: "OrderedDict[bytes, Optional[int]]" = OrderedDict()
+        # Last text casefolded and its casefolded form; identify_provider and
+        # update_from_openai_result are usually called with the same invoice text
+        self._last_folded: Tuple[Optional[str], str] = (None, "")
         self.hit_count = 0 # Initialize hit counter
+        # Guards the mappings, compiled patterns and hit counter when a mapper is
+        # shared between worker threads (reentrant: learning calls add_mapping)
+        self._lock = threading.RLock()
 
         self._load_mappings_from_json()
+        self._replay_journal()
         self._compile_patterns()
 
     def _load_mappings_from_json(self) -> None:
@@ -51,8 +299,9 @@ class ProviderMapper:
                  return # Exit if file still doesn't exist
 
         try:
-            with open(self.mapping_file, 'r') as f:
-                self.mappings_data = json.load(f)
+            raw_data = self.mapping_file.read_bytes()
+            self._compacted_size = len(raw_data)
+            self.mappings_data = _json_loads(raw_data)
             
             # Check version
             loaded_version = self.mappings_data.get("version", "0.0.0")
@@ -66,7 +315,14 @@ class ProviderMapper:
                 self.mappings_data["mappings"] = [] # Reset to empty list to avoid errors
                 # Consider saving the corrected structure back
             
-            self.provider_mappings = self.mappings_data.get("mappings", [])
+            self.provider_mappings = []
+            for mapping in self.mappings_data.get("mappings", []):
+                if isinstance(mapping, dict):
+                    self.provider_mappings.append(ProviderMapping.from_dict(mapping))
+                else:
+                    logger.warning(f"Skipping invalid mapping entry in {self.mapping_file}: {mapping!r}")
+            # The records live in provider_mappings; the list is rebuilt on save
+            self.mappings_data["mappings"] = []
             logger.info(f"Loaded {len(self.provider_mappings)} provider mappings from {self.mapping_file}")
             
         except json.JSONDecodeError as e:
@@ -79,22 +335,49 @@ class ProviderMapper:
             logger.error(f"Error reading mapping file {self.mapping_file}: {str(e)}. No mappings loaded.")
             self.provider_mappings = [] # Ensure it's an empty list on error
 
+    def _replay_journal(self) -> None:
+        """Apply changes journaled by a run that ended before saving them."""
+        try:
+            raw_journal = self.journal_file.read_bytes()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error(f"Error reading mapping journal {self.journal_file}: {str(e)}. Journaled changes not loaded.")
+            return
+        self._journal_size = len(raw_journal)
+        lines = raw_journal.splitlines()
+
+        replayed = 0
+        keys = {(m.pattern, m.provider) for m in self.provider_mappings}
+        for line in lines:
+            try:
+                entry = _json_loads(line)
+                if entry["op"] == "add":
+                    mapping = ProviderMapping.from_dict(entry["mapping"])
+                    key = (mapping.pattern, mapping.provider)
+                    if key not in keys:
+                        keys.add(key)
+                        self.provider_mappings.append(mapping)
+                elif entry["op"] == "remove":
+                    self.provider_mappings = [m for m in self.provider_mappings if m.pattern != entry["pattern"]]
+                    keys = {key for key in keys if key[0] != entry["pattern"]}
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # A run that crashed mid-write can leave a truncated last line
+                logger.warning(f"Ignoring the rest of mapping journal {self.journal_file} after an invalid entry: {str(e)}")
+                break
+            replayed += 1
+        if replayed:
+            logger.info(f"Replayed {replayed} unsaved mapping change(s) from {self.journal_file}")
+            # Merge them into the mapping file on the next save
+            self._dirty = True
+
     def _create_default_mapping_file(self) -> None:
         """Creates a default mapping file if one doesn't exist."""
-        default_structure = {
-            "version": "1.0.0",
-            "last_updated": datetime.utcnow().isoformat() + "Z",
-            "schema": {
-                "description": "Provider mapping configuration file",
-                "required_fields": ["pattern", "provider", "confidence", "last_used"],
-                "pattern_format": "regex",
-                "confidence_range": [0, 1]
-            },
-            "mappings": [] # Start with no default mappings, let them be learned or added manually
-        }
+        content = _DEFAULT_MAPPING_FILE_TEMPLATE.replace(
+            _json_dumps(_DEFAULT_TIMESTAMP_PLACEHOLDER), _json_dumps(_utc_iso()), 1
+        )
         try:
-            with open(self.mapping_file, 'w') as f:
-                json.dump(default_structure, f, indent=4)
+            self.mapping_file.write_bytes(content)
             logger.info(f"Created default mapping file at {self.mapping_file}")
         except PermissionError as e:
             logger.critical(f"Permission denied when trying to create default mapping file at {self.mapping_file}: {str(e)}")
@@ -104,37 +387,308 @@ class ProviderMapper:
     def _compile_patterns(self) -> None:
         """Compile regex patterns from the loaded mappings for efficient matching."""
         self.compiled_patterns = {}
+        self._compiled_by_source = {}
+        self._mapping_keys = {(mapping.pattern, mapping.provider) for mapping in self.provider_mappings}
+        self._fold_text = all(_fold_pattern(mapping.pattern) is not None
+                              for mapping in self.provider_mappings
+                              if mapping.pattern and mapping.provider)
         for mapping in self.provider_mappings:
-            pattern = mapping.get("pattern")
-            provider = mapping.get("provider")
+            pattern = mapping.pattern
+            provider = mapping.provider
             if pattern and provider:
                 try:
                     # Compile case-insensitive pattern
-                    regex = re.compile(pattern, re.IGNORECASE)
-                    self.compiled_patterns[regex] = provider
+                    overrides = pattern in self._compiled_by_source
+                    regex = self._compiled_by_source.get(pattern) or self._compile_pattern(pattern)
+                    self._compiled_by_source[pattern] = regex
+                    self._set_compiled_provider(regex, provider, overrides)
                 except re.error as e:
                     logger.warning(f"Invalid regex pattern '{pattern}' in mapping for provider '{provider}': {str(e)}. Skipping this pattern.")
             else:
-                logger.warning(f"Skipping mapping due to missing 'pattern' or 'provider': {mapping}")
+                logger.warning(f"Skipping mapping due to missing 'pattern' or 'provider': {mapping.to_dict()}")
         logger.debug(f"Compiled {len(self.compiled_patterns)} regex patterns.")
+        self._build_fused_pattern()
+
+    def _set_compiled_provider(self, regex: re.Pattern, provider: str, overrides: bool) -> None:
+        """
+        Map a compiled pattern to its provider.
+        
+        A later mapping with the very same pattern replaces the earlier one, so
+        corrections win. A pattern that only compiles to the same regex, like one
+        differing in case, keeps the earlier mapping, which would have matched first.
+        
+        Args:
+            regex: The compiled pattern
+            provider: The provider of the mapping
+            overrides: Whether an earlier mapping has the very same pattern
+        """
+        if overrides:
+            self.compiled_patterns[regex] = provider
+        else:
+            self.compiled_patterns.setdefault(regex, provider)
+
+    def _compile_pattern(self, pattern: str) -> re.Pattern:
+        """Compile a mapping pattern for matching in the current case mode."""
+        if self._fold_text:
+            return _cached_compile(_fold_pattern(pattern))
+        return _cached_compile(pattern, re.IGNORECASE)
+
+    def _build_fused_pattern(self) -> None:
+        """
+        Fuse the compiled patterns into a single alternation with one named group each.
+        
+        Patterns that can't be wrapped in a group are left out of the alternation
+        and tried one by one: numbered backreferences would point at the wrong
+        group, and inline flags are only allowed at the start of a pattern.
+        """
+        self._identify_cache.clear()
+        # Keep the hit counts of patterns that survive a rebuild
+        previous_counts = dict(zip(self._patterns, self._hit_counts))
+        self._patterns = list(self.compiled_patterns)
+        self._providers = list(self.compiled_patterns.values())
+        self._end_sensitive = {index for index, pattern in enumerate(self._patterns)
+                               if _END_SENSITIVE_RE.search(pattern.pattern)}
+        self._hit_counts = array.array('Q', (previous_counts.get(pattern, 0) for pattern in self._patterns))
+        self._fused_pattern = None
+        self._fused_group_order = {}
+        self._fused_indices = []
+        self._unfused_indices = list(range(len(self._patterns)))
+        self._hyperscan_db = self._build_hyperscan_database() if USE_HYPERSCAN else None
+        
+        flags = 0 if self._fold_text else re.IGNORECASE
+        fused_indices = [index for index, pattern in enumerate(self._patterns)
+                         if self._can_fuse(pattern.pattern, flags)]
+        if not fused_indices:
+            self._build_unfused_literals()
+            return
+        fused = "|".join(f"(?P<_p{index}>{self._patterns[index].pattern})" for index in fused_indices)
+        try:
+            fused_pattern = _cached_compile(fused, flags)
+        except re.error as e:
+            # e.g. the same group name used by two patterns
+            logger.debug(f"Could not fuse provider patterns, matching them one by one: {str(e)}")
+            return
+        # The wrapping group closes last, so it is the match's lastindex even when
+        # the pattern has groups of its own
+        self._fused_group_order = {fused_pattern.groupindex[f"_p{index}"]: index for index in fused_indices}
+        self._fused_indices = fused_indices
+        self._unfused_indices = sorted(set(self._unfused_indices) - set(fused_indices))
+        self._fused_pattern = fused_pattern
+        self._build_unfused_literals()
+        if self._unfused_indices:
+            logger.debug(f"Matching {len(self._unfused_indices)} provider pattern(s) outside the fused alternation.")
+
+    def _build_hyperscan_database(self) -> Optional[Any]:
+        """Compile all patterns into a Hyperscan database, or return None if any isn't supported."""
+        if not self._patterns:
+            return None
+        hs_flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+        database = hyperscan.Database()
+        try:
+            database.compile(
+                expressions=[pattern.pattern.encode("utf-8") for pattern in self._patterns],
+                ids=list(range(len(self._patterns))),
+                elements=len(self._patterns),
+                flags=[hs_flags] * len(self._patterns),
+            )
+        except hyperscan.error as e:
+            # e.g. backreferences or lookarounds, which Hyperscan doesn't support
+            logger.debug(f"Could not compile provider patterns with Hyperscan, using re: {str(e)}")
+            return None
+        return database
+
+    def _hyperscan_find_provider(self, data: bytes) -> Optional[int]:
+        """Return the position of the first pattern in order matching UTF-8 data using Hyperscan."""
+        first: List[int] = []
+        
+        def on_match(pattern_id: int, start: int, end: int, flags: int, context: Any) -> bool:
+            if not first or pattern_id < first[0]:
+                first[:] = [pattern_id]
+            # Stop scanning once the first pattern in order has matched
+            return pattern_id == 0
+        
+        try:
+            self._hyperscan_db.scan(data, match_event_handler=on_match)
+        except getattr(hyperscan, "ScanTerminated", ()):
+            pass
+        return first[0] if first else None
+
+    def _build_unfused_literals(self) -> None:
+        """Find the literals required by the patterns tried on their own."""
+        self._unfused_literals = {}
+        # Only casefolded patterns can be compared with the casefolded text as plain strings
+        if not self._fold_text:
+            return
+        for index in self._unfused_indices:
+            literal = _required_literal(self._patterns[index].pattern)
+            if literal:
+                self._unfused_literals[index] = literal
+
+    @staticmethod
+    def _can_fuse(pattern: str, flags: int) -> bool:
+        """Return whether a pattern keeps its meaning inside the fused alternation."""
+        if _NUMBERED_GROUP_REF_RE.search(pattern):
+            return False
+        try:
+            _cached_compile(f"(?:{pattern})", flags)
+        except re.error:
+            return False
+        return True
 
     def identify_provider(self, text: str) -> Optional[str]:
         """
         Try to identify the provider from the given text using compiled regex patterns.
         
+        The first HEADER_SCAN_CHARS characters are searched first; the whole text
+        is only searched when no pattern matches there. Results are remembered for
+        the last IDENTIFY_CACHE_SIZE distinct texts until the mappings change.
+        
         Args:
             text: The text to search for provider identifiers
             
         Returns:
             The canonical provider name if found, None otherwise
         """
-        for pattern, provider in self.compiled_patterns.items():
-            if pattern.search(text):
-                logger.info(f"Identified provider '{provider}' using pattern matching: {pattern.pattern}")
-                # Future enhancement: Update last_used timestamp here
-                self.hit_count += 1 # Increment hit counter
-                return provider
-        return None
+        key = self._identify_cache_key(text)
+        with self._lock:
+            return self._identify_locked(text, key)
+
+    def identify_providers_batch(self, texts: Sequence[str]) -> List[Optional[str]]:
+        """
+        Identify the providers of several texts.
+        
+        The cache keys of all texts are computed before the lock is taken, and the
+        lock is then held once for the whole batch. Each text is matched on its own
+        as by identify_provider(), so patterns never match across two invoices, and
+        repeated texts are matched once and then served from the cache.
+        
+        Args:
+            texts: The texts to search for provider identifiers
+            
+        Returns:
+            The canonical provider name (or None) for each text, in order
+        """
+        keys = [self._identify_cache_key(text) for text in texts]
+        with self._lock:
+            return [self._identify_locked(text, key) for text, key in zip(texts, keys)]
+
+    @staticmethod
+    def _identify_cache_key(text: str) -> bytes:
+        """Return the identify cache key of a text."""
+        # Keyed by digest so cached entries don't keep whole invoice texts alive
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _identify_locked(self, text: str, key: bytes) -> Optional[str]:
+        """Identify the provider of a text through the cache; the lock must be held."""
+        if key in self._identify_cache:
+            self._identify_cache.move_to_end(key)
+            found = self._identify_cache[key]
+        else:
+            found = self._identify_uncached(text)
+            self._identify_cache[key] = found
+            if len(self._identify_cache) > IDENTIFY_CACHE_SIZE:
+                self._identify_cache.popitem(last=False)
+        if found is None:
+            return None
+        return self._record_hit(found)
+
+    def _identify_uncached(self, text: str) -> Optional[int]:
+        """Return the position of the pattern identifying the text's provider, if any."""
+        if self._fold_text:
+            text = self._casefold(text)
+        found = None
+        if len(text) > HEADER_SCAN_CHARS:
+            found = self._find_provider(text, HEADER_SCAN_CHARS)
+            if found in self._end_sensitive and not self._matches_in_header(found, text):
+                found = None # Only matched at the cut; the full pass decides
+        if found is None:
+            found = self._find_provider(text, len(text))
+        return found
+    
+    def _matches_in_header(self, index: int, text: str) -> bool:
+        """Return whether a pattern matches the full text somewhere it matched the header."""
+        pattern = self._patterns[index]
+        return any(pattern.match(text, match.start())
+                   for match in pattern.finditer(text, 0, HEADER_SCAN_CHARS))
+    
+    def _casefold(self, text: str) -> str:
+        """Return text.casefold(), reusing the result for the same text object."""
+        last_text, last_folded = self._last_folded
+        if text is not last_text:
+            last_folded = text.casefold()
+            self._last_folded = (text, last_folded)
+        return last_folded
+    
+    def _find_provider(self, text: str, endpos: int) -> Optional[int]:
+        """Return the position of the first pattern in order matching text[:endpos], if any."""
+        if self._hyperscan_db is not None:
+            try:
+                return self._hyperscan_find_provider(text[:endpos].encode("utf-8"))
+            except UnicodeEncodeError:
+                pass # Lone surrogates aren't valid UTF-8, which Hyperscan requires; use re
+        
+        patterns = self._patterns
+        best = None
+        if self._fused_pattern is not None:
+            best = self._first_fused_match(text, endpos)
+        
+        # Patterns outside the alternation only matter if they come before the fused match
+        literals = self._unfused_literals
+        for index in self._unfused_indices:
+            if best is not None and index > best:
+                break
+            literal = literals.get(index)
+            if literal is not None and text.find(literal, 0, endpos) < 0:
+                continue # The pattern can't match without its literal
+            if patterns[index].search(text, 0, endpos):
+                return index
+        return best
+
+    def _first_fused_match(self, text: str, endpos: int) -> Optional[int]:
+        """Return the position of the first fused pattern in order matching text[:endpos], if any."""
+        # The fused scan finds the leftmost match, but the first pattern in order
+        # wins. Earlier patterns can't match at or before that position, so the scan
+        # resumes just after it until no earlier pattern matches further on.
+        match = self._fused_pattern.search(text, 0, endpos)
+        best = None
+        rescans = len(self._fused_indices)
+        while match is not None:
+            index = self._fused_group_order[match.lastindex]
+            if best is None or index < best:
+                best = index
+                if best == self._fused_indices[0]:
+                    return best
+            rescans -= 1
+            if rescans <= 0:
+                # The text matches over and over (e.g. a very generic pattern); checking
+                # the earlier patterns one by one is cheaper from here on
+                for earlier in self._fused_indices:
+                    if earlier >= best:
+                        break
+                    if self._patterns[earlier].search(text, match.start() + 1, endpos):
+                        return earlier
+                return best
+            match = self._fused_pattern.search(text, match.start() + 1, endpos)
+        return best
+
+    def _record_hit(self, index: int) -> str:
+        """Log and count a successful provider identification."""
+        provider = self._providers[index]
+        logger.info(f"Identified provider '{provider}' using pattern matching: {self._patterns[index].pattern}")
+        # Future enhancement: Update last_used timestamp here
+        self._hit_counts[index] += 1
+        self.hit_count += 1 # Increment hit counter
+        return provider
+
+    def get_pattern_hit_counts(self) -> Dict[str, int]:
+        """
+        Get how often each compiled pattern identified a provider since the mapper was created.
+        
+        Returns:
+            Dictionary of pattern string -> number of hits.
+        """
+        with self._lock:
+            return {pattern.pattern: count for pattern, count in zip(self._patterns, self._hit_counts)}
 
     def add_mapping(self, pattern: str, provider: str, confidence: float = 0.8, source: str = "learned") -> None:
         """
@@ -147,42 +701,45 @@ class ProviderMapper:
             confidence: Confidence score (default 0.8 for learned)
             source: Source of the mapping (e.g., 'manual', 'learned')
         """
-        # Avoid adding duplicates based on pattern AND provider
-        for existing_mapping in self.provider_mappings:
-            if existing_mapping.get("pattern") == pattern and existing_mapping.get("provider") == provider:
+        with self._lock:
+            # Avoid adding duplicates based on pattern AND provider
+            if (pattern, provider) in self._mapping_keys:
                 logger.debug(f"Mapping for pattern '{pattern}' and provider '{provider}' already exists. Skipping add.")
                 return
 
-        # Validate pattern and confidence
-        if not pattern or not provider:
-            logger.warning(f"Skipping add: Pattern and provider cannot be empty.")
-            return
-        try:
-            re.compile(pattern) # Check if pattern is a valid regex
-        except re.error as e:
-            logger.error(f"Invalid regex pattern provided '{pattern}': {e}. Skipping add.")
-            return
-        if not (0.0 <= confidence <= 1.0):
-             logger.warning(f"Confidence score {confidence} out of range [0.0, 1.0]. Clamping.")
-             confidence = max(0.0, min(1.0, confidence))
-
-        new_mapping = {
-            "pattern": pattern,
-            "provider": provider,
-            "confidence": confidence,
-            "last_used": datetime.utcnow().isoformat() + "Z",
-            "source": source
-        }
-        self.provider_mappings.append(new_mapping)
+            # Validate pattern and confidence
+            if not pattern or not provider:
+                logger.warning(f"Skipping add: Pattern and provider cannot be empty.")
+                return
+            try:
+                _cached_compile(pattern) # Check if pattern is a valid regex
+            except re.error as e:
+                logger.error(f"Invalid regex pattern provided '{pattern}': {e}. Skipping add.")
+                return
+            if not (0.0 <= confidence <= 1.0):
+                 logger.warning(f"Confidence score {confidence} out of range [0.0, 1.0]. Clamping.")
+                 confidence = max(0.0, min(1.0, confidence))
+
+            new_mapping = ProviderMapping(pattern, provider, confidence,
+                                          _utc_iso(), source)
+            self.provider_mappings.append(new_mapping)
+            self._mapping_keys.add((pattern, provider))
         
-        # Update compiled patterns immediately
-        try:
-            regex = re.compile(pattern, re.IGNORECASE)
-            self.compiled_patterns[regex] = provider
-            logger.info(f"Added new mapping (in memory): {pattern} -> {provider}")
-            self._save_mappings_to_json()
-        except re.error as e:
-             logger.warning(f"Invalid regex pattern '{pattern}' for provider '{provider}': {str(e)}. Mapping added to list but not compiled.")
+            # Update compiled patterns immediately
+            try:
+                if self._fold_text and _fold_pattern(pattern) is None:
+                    # All patterns have to be matched case-insensitively again
+                    self._compile_patterns()
+                else:
+                    overrides = pattern in self._compiled_by_source
+                    regex = self._compile_pattern(pattern)
+                    self._compiled_by_source[pattern] = regex
+                    self._set_compiled_provider(regex, provider, overrides)
+                    self._build_fused_pattern()
+                logger.info(f"Added new mapping (in memory): {pattern} -> {provider}")
+                self._mark_changed({"op": "add", "mapping": new_mapping.to_dict()})
+            except re.error as e:
+                 logger.warning(f"Invalid regex pattern '{pattern}' for provider '{provider}': {str(e)}. Mapping added to list but not compiled.")
 
     def get_all_mappings(self) -> List[Dict[str, Any]]:
         """
@@ -191,7 +748,7 @@ class ProviderMapper:
         Returns:
             List of all provider mapping dictionaries.
         """
-        return self.provider_mappings.copy()
+        return [mapping.to_dict() for mapping in self.provider_mappings]
 
     def update_from_openai_result(self, text: str, identified_provider: str) -> None:
         """
@@ -202,45 +759,91 @@ class ProviderMapper:
             text: The original text that was processed
             identified_provider: The provider identified by OpenAI
         """
-        # Extract potential patterns from the text
-        # Simple implementation: use identified provider name itself as a pattern if found in text
-        # More sophisticated logic could be added here (e.g., using parts of the name, checking context)
-        escaped_provider = re.escape(identified_provider)
-        if re.search(escaped_provider, text, re.IGNORECASE): 
-             # Check if this exact pattern already exists for this provider
-             pattern_exists = any(
-                 m.get("pattern") == escaped_provider and m.get("provider") == identified_provider 
-                 for m in self.provider_mappings
-             )
-             if not pattern_exists:
-                 logger.info(f"Learned new pattern from OpenAI result: '{escaped_provider}' -> '{identified_provider}'")
-                 self.add_mapping(escaped_provider, identified_provider, confidence=0.85, source="learned_openai")
-             else:
-                 logger.debug(f"Pattern '{escaped_provider}' for provider '{identified_provider}' already exists.")
-        else:
-            # Optional: Try extracting other potential keywords if direct match fails
-            words = text.split()
-            for word in words:
-                # Example heuristic: word longer than 3 chars, present in identified_provider name
-                if len(word) > 3 and word.lower() in identified_provider.lower():
-                    pattern = re.escape(word)
-                    pattern_exists = any(
-                        m.get("pattern") == pattern and m.get("provider") == identified_provider
-                        for m in self.provider_mappings
-                    )
-                    if not pattern_exists:
-                        logger.info(f"Learned potential partial pattern from OpenAI result: '{pattern}' -> '{identified_provider}'")
-                        self.add_mapping(pattern, identified_provider, confidence=0.75, source="learned_openai_partial")
-                        break # Maybe only add one partial pattern per result
-
-    # Placeholder for save method - to be implemented in the next task
+        with self._lock:
+            # Extract potential patterns from the text
+            # Simple implementation: use identified provider name itself as a pattern if found in text
+            # More sophisticated logic could be added here (e.g., using parts of the name, checking context)
+            escaped_provider = _escape_provider(identified_provider)
+            provider_cf = identified_provider.casefold()
+            if provider_cf in self._casefold(text):
+                 # Check if this exact pattern already exists for this provider
+                 if (escaped_provider, identified_provider) not in self._mapping_keys:
+                     logger.info(f"Learned new pattern from OpenAI result: '{escaped_provider}' -> '{identified_provider}'")
+                     self.add_mapping(escaped_provider, identified_provider, confidence=0.85, source="learned_openai")
+                 else:
+                     logger.debug(f"Pattern '{escaped_provider}' for provider '{identified_provider}' already exists.")
+            else:
+                # Optional: Try extracting other potential keywords if direct match fails
+                # Words are scanned lazily, so the loop stops at the first new pattern
+                for word_match in _WORD_RE.finditer(text):
+                    word = word_match.group()
+                    # Example heuristic: word longer than 3 chars, present in identified_provider name
+                    if len(word) > 3 and word.casefold() in provider_cf:
+                        pattern = re.escape(word)
+                        if (pattern, identified_provider) not in self._mapping_keys:
+                            logger.info(f"Learned potential partial pattern from OpenAI result: '{pattern}' -> '{identified_provider}'")
+                            self.add_mapping(pattern, identified_provider, confidence=0.75, source="learned_openai_partial")
+                            break # Maybe only add one partial pattern per result
+
+    def _mark_changed(self, entry: Dict[str, Any]) -> None:
+        """Record an in-memory change, saving it right away when autosave is on and journaling it otherwise."""
+        self._dirty = True
+        if self.autosave and not self._suppress_save:
+            self._save_mappings_to_json()
+            return
+        entry = {**entry, "ts": _utc_iso()}
+        try:
+            line = _json_dumps(entry) + b"\n"
+            with open(self.journal_file, 'ab') as f:
+                f.write(line)
+        except (IOError, OSError, TypeError) as e:
+            # The change is still saved by save(); it just won't survive a crash
+            logger.warning(f"Could not journal mapping change to {self.journal_file}: {str(e)}")
+            return
+        self._journal_size += len(line)
+        if self._journal_size > JOURNAL_COMPACT_RATIO * self._compacted_size:
+            logger.debug(f"Compacting mapping journal {self.journal_file} ({self._journal_size} bytes)")
+            self._save_mappings_to_json()
+
+    @contextmanager
+    def batch(self) -> Iterator["ProviderMapper"]:
+        """
+        Defer autosaves until the block exits, then save all changes at once.
+        
+        Callers that add or learn many mappings in a row (e.g. over a folder of
+        invoices) should wrap the loop in ``with mapper.batch():`` so the file is
+        rewritten once instead of after every change. Blocks can be nested; the
+        outermost one saves.
+        """
+        with self._lock:
+            self._suppress_save += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._suppress_save -= 1
+                if not self._suppress_save:
+                    self.save()
+
+    def save(self) -> None:
+        """Write pending changes to the mapping file, if there are any."""
+        with self._lock:
+            if self._dirty:
+                self._save_mappings_to_json()
+
     def _save_mappings_to_json(self) -> None:
         """Save the current in-memory mappings back to the JSON file using atomic operations."""
-        # Create backup before saving
+        # Create backup before saving. The new version goes to a new file that replaces
+        # this one, so a hard link keeps the old contents without copying them
         backup_file = self.mapping_file.with_suffix(self.mapping_file.suffix + ".bak")
-        if self.mapping_file.exists():
+        if self.keep_backup and self.mapping_file.exists():
             try:
-                shutil.copy2(self.mapping_file, backup_file)
+                try:
+                    backup_file.unlink(missing_ok=True)
+                    os.link(self.mapping_file, backup_file)
+                except OSError:
+                    # Hard links not supported by the filesystem
+                    shutil.copy2(self.mapping_file, backup_file)
                 logger.debug(f"Created backup file: {backup_file}")
             except (IOError, OSError) as e:
                  logger.warning(f"Could not create backup file {backup_file}: {e}")
@@ -249,24 +852,36 @@ class ProviderMapper:
         if not self.mappings_data:
             self.mappings_data = {"version": "1.0.0", "schema": {}, "mappings": []}
 
-        # Update the mappings list and last_updated timestamp
-        self.mappings_data["mappings"] = self.provider_mappings
-        self.mappings_data["last_updated"] = datetime.utcnow().isoformat() + "Z"
+        # Update the last_updated timestamp; the mappings list is only built for writing
+        self.mappings_data["last_updated"] = _utc_iso()
+        file_data = {**self.mappings_data, "mappings": [mapping.to_dict() for mapping in self.provider_mappings]}
 
         temp_file_path = None
         try:
+            payload = memoryview(_json_dumps(file_data, indent=True))
             # Create a temporary file in the same directory to ensure atomic move
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, dir=self.mapping_file.parent, suffix=".tmp") as temp_f:
-                temp_file_path = Path(temp_f.name)
-                json.dump(self.mappings_data, temp_f, indent=4)
+            temp_file_path = self._save_dir / f".{self.mapping_file.name}.{os.getpid()}.{next(_save_counter)}.tmp"
+            fd = os.open(temp_file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+            try:
+                while payload:
+                    payload = payload[os.write(fd, payload):]
+                # Make sure the data is on disk before the rename makes it the mapping file
+                os.fsync(fd)
+            finally:
+                os.close(fd)
             
             # Atomically replace the original file with the temporary file
-            shutil.move(str(temp_file_path), str(self.mapping_file))
+            os.replace(temp_file_path, self.mapping_file)
+            self._fsync_directory()
+            self._dirty = False
+            # The file now holds every journaled change
+            self._discard_journal()
             logger.info(f"Saved {len(self.provider_mappings)} mappings atomically to {self.mapping_file}")
             
             # Log file size after successful save
             try:
                 file_size = self.mapping_file.stat().st_size
+                self._compacted_size = file_size
                 logger.debug(f"Mapping file size: {file_size} bytes")
             except OSError:
                  pass # Ignore error getting size
@@ -296,10 +911,32 @@ class ProviderMapper:
                 except OSError as cleanup_e:
                      logger.error(f"Error cleaning up temporary file {temp_file_path}: {cleanup_e}")
 
+    def _fsync_directory(self) -> None:
+        """Flush the mapping file's directory entry so a completed save survives a crash."""
+        try:
+            fd = os.open(self.mapping_file.parent, os.O_RDONLY)
+        except OSError:
+            return # e.g. directories can't be opened on Windows
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _discard_journal(self) -> None:
+        """Delete the journal of unsaved changes."""
+        self._journal_size = 0
+        try:
+            self.journal_file.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove mapping journal {self.journal_file}: {str(e)}")
+
     def remove_mapping(self, pattern_to_remove: str) -> bool:
         """
-        Remove a mapping based on its pattern. This currently only updates the in-memory representation.
-        Saving to JSON needs to be implemented separately.
+        Remove a mapping based on its pattern and save the updated list (see autosave).
         
         Args:
             pattern_to_remove: The regex pattern string of the mapping to remove.
@@ -307,38 +944,68 @@ class ProviderMapper:
         Returns:
             True if a mapping was removed, False otherwise.
         """
-        initial_length = len(self.provider_mappings)
-        self.provider_mappings = [m for m in self.provider_mappings if m.get("pattern") != pattern_to_remove]
-        removed_count = initial_length - len(self.provider_mappings)
-
-        if removed_count > 0:
-            logger.info(f"Removed {removed_count} mapping(s) with pattern '{pattern_to_remove}' (in memory).")
-            # Recompile patterns after removal
-            self._compile_patterns()
-            # Note: Need to call save method to persist this change
-            self._save_mappings_to_json()
-            return True
-        else:
-            logger.warning(f"Pattern '{pattern_to_remove}' not found in mappings.")
-            return False
+        with self._lock:
+            initial_length = len(self.provider_mappings)
+            self.provider_mappings = [m for m in self.provider_mappings if m.pattern != pattern_to_remove]
+            removed_count = initial_length - len(self.provider_mappings)
+
+            if removed_count > 0:
+                logger.info(f"Removed {removed_count} mapping(s) with pattern '{pattern_to_remove}' (in memory).")
+                if not self._fold_text and _fold_pattern(pattern_to_remove) is None:
+                    # Removing it may allow casefolded matching again; recompile everything
+                    self._compile_patterns()
+                else:
+                    self._drop_compiled_pattern(pattern_to_remove)
+                self._mark_changed({"op": "remove", "pattern": pattern_to_remove})
+                return True
+            else:
+                logger.warning(f"Pattern '{pattern_to_remove}' not found in mappings.")
+                return False
+
+    def _drop_compiled_pattern(self, pattern: str) -> None:
+        """Update the compiled patterns after removing every mapping with this pattern."""
+        self._compiled_by_source.pop(pattern, None)
+        self._mapping_keys = {key for key in self._mapping_keys if key[0] != pattern}
+        # Rebuild in mapping order from the already compiled regexes, as another
+        # mapping's pattern may compile to the same regex
+        self.compiled_patterns = {}
+        seen_patterns: Set[str] = set()
+        for mapping in self.provider_mappings:
+            regex = self._compiled_by_source.get(mapping.pattern)
+            if regex is not None and mapping.provider:
+                self._set_compiled_provider(regex, mapping.provider, mapping.pattern in seen_patterns)
+                seen_patterns.add(mapping.pattern)
+        self._build_fused_pattern()
 
     def restore_from_backup(self) -> bool:
         """Restores the mapping file from the backup (.bak) file if it exists."""
-        backup_file = self.mapping_file.with_suffix(self.mapping_file.suffix + ".bak")
-        if not backup_file.exists():
-            logger.error(f"Restore failed: Backup file not found at {backup_file}")
-            return False
+        with self._lock:
+            backup_file = self.mapping_file.with_suffix(self.mapping_file.suffix + ".bak")
+            if not backup_file.exists():
+                logger.error(f"Restore failed: Backup file not found at {backup_file}")
+                return False
 
-        try:
-            shutil.copy2(backup_file, self.mapping_file)
-            logger.info(f"Successfully restored mapping file from {backup_file}")
-            # Reload mappings after restoring
-            self._load_mappings_from_json()
-            self._compile_patterns()
-            return True
-        except (IOError, OSError) as e:
-            logger.error(f"Restore failed: Error copying backup file {backup_file} to {self.mapping_file}: {e}")
-            return False
+            temp_file_path = self._save_dir / f".{self.mapping_file.name}.{os.getpid()}.{next(_save_counter)}.restore.tmp"
+            try:
+                try:
+                    # Saves never write the mapping file in place, so it can share the backup's inode
+                    os.link(backup_file, temp_file_path)
+                except OSError:
+                    # Hard links not supported by the filesystem
+                    shutil.copy2(backup_file, temp_file_path)
+                os.replace(temp_file_path, self.mapping_file)
+                self._fsync_directory()
+                logger.info(f"Successfully restored mapping file from {backup_file}")
+                # Reload mappings after restoring; unsaved changes are discarded
+                self._discard_journal()
+                self._load_mappings_from_json()
+                self._compile_patterns()
+                self._dirty = False
+                return True
+            except (IOError, OSError) as e:
+                logger.error(f"Restore failed: Error copying backup file {backup_file} to {self.mapping_file}: {e}")
+                temp_file_path.unlink(missing_ok=True)
+                return False
 
 # Remove the old helper functions if they are fully replaced by class methods
 # def _load_mappings(mapping_file: Path) -> Dict[str, str]: ...
@@ -0,0 +1,26 @@
+"""Shared helpers for the invoice processor test suites."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Base class giving each test its own directory, all removed at once after the class."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Create the base directory, in memory when /dev/shm is available."""
+        cls.base_dir = Path(tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None))
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the directories of all tests of the class."""
+        shutil.rmtree(cls.base_dir, ignore_errors=True)
+    
+    def setUp(self):
+        """Create the test's directory."""
+        self.test_dir = self.base_dir / self._testMethodName
+        os.mkdir(self.test_dir)
@@ -1,17 +1,20 @@
 import unittest
 import json
+import re
 import tempfile
 import shutil
 from pathlib import Path
 from unittest.mock import patch, mock_open, MagicMock
 from datetime import datetime
-from provider_mapping import ProviderMapper
+from concurrent.futures import ThreadPoolExecutor
+from provider_mapping import HEADER_SCAN_CHARS, ProviderMapper
+from test_helpers import TempDirTestCase
 
-class TestProviderMapper(unittest.TestCase):
+class TestProviderMapper(TempDirTestCase):
     def setUp(self):
-        self.mapping_file = Path("test_mappings.json")
-        if self.mapping_file.exists():
-            self.mapping_file.unlink()
+        super().setUp()
+        self.mapping_file = self.test_dir / "test_mappings.json"
+        self.journal_file = self.test_dir / "test_mappings.json.journal"
 
     def test_add_mapping(self):
         """Test adding a new mapping updates memory, file, and compiled patterns."""
@@ -41,13 +44,22 @@ class TestProviderMapper(unittest.TestCase):
             self.assertEqual(data["mappings"][0]["pattern"], "new_pattern")
             self.assertIn("last_updated", data)
             
+    def test_missing_file_is_created_with_default_content(self):
+        """Test that a missing mapping file is created with the schema and a fresh timestamp."""
+        ProviderMapper(mapping_file=self.mapping_file)
+        with open(self.mapping_file, 'r') as f:
+            data = json.load(f)
+        self.assertEqual(data["mappings"], [])
+        self.assertEqual(data["schema"]["pattern_format"], "regex")
+        datetime.fromisoformat(data["last_updated"].replace("Z", "+00:00"))
+
     def test_add_mapping_invalid_regex(self):
         """Test adding a mapping with an invalid regex logs error and doesn't add."""
         mapper = ProviderMapper(mapping_file=self.mapping_file)
         initial_mappings = len(mapper.get_all_mappings())
         with self.assertLogs(level='ERROR') as log:
             mapper.add_mapping("(", "InvalidRegexProvider") # Invalid regex
-            self.assertTrue(any("Invalid regex pattern provided" in msg for msg in log.output))
+            self.assertRegex("\n".join(log.output), r"Invalid regex pattern provided")
         # Check it wasn't added
         self.assertEqual(len(mapper.get_all_mappings()), initial_mappings)
         self.assertEqual(len(mapper.compiled_patterns), initial_mappings)
@@ -118,13 +130,345 @@ class TestProviderMapper(unittest.TestCase):
         # Ensure original source wasn't overwritten
         self.assertEqual(mapper.get_all_mappings()[0]["source"], "manual")
 
+    def test_identify_provider_first_pattern_wins(self):
+        """Test that the fused matcher keeps the loop's first-pattern-wins order."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Google\ Workspace", "Google Workspace", source="manual")
+        mapper.add_mapping(r"Google", "Google", source="manual")
+        self.assertIsNotNone(mapper._fused_pattern)
+        
+        # "Google" matches further left, but the Workspace mapping comes first
+        self.assertEqual(mapper.identify_provider("Google LLC - Google Workspace"), "Google Workspace")
+        self.assertEqual(mapper.identify_provider("Google Cloud"), "Google")
+        self.assertIsNone(mapper.identify_provider("Unknown vendor"))
+        self.assertEqual(mapper.hit_count, 2)
+
+    def test_identify_provider_with_group_patterns(self):
+        """Test that patterns with backreferences are matched outside the fused alternation."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"(ab)\1", "Repeated", source="manual")
+        mapper.add_mapping(r"plain", "Plain", source="manual")
+        mapper.add_mapping(r"(?i)Late\ flag", "Late", source="manual")
+        self.assertEqual(mapper._fused_indices, [1])
+        
+        self.assertEqual(mapper.identify_provider("xx ABab plain"), "Repeated")
+        self.assertEqual(mapper.identify_provider("ab plain"), "Plain")
+        self.assertEqual(mapper.identify_provider("late flag"), "Late")
+
+    def test_unfused_patterns_are_prefiltered_by_literal(self):
+        """Test that patterns matched on their own are skipped when their literal is missing."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Invoice\ ([0-9])\1", "Repeated", source="manual")
+        mapper.add_mapping(r"plain", "Plain", source="manual")
+        self.assertEqual(mapper._unfused_literals, {0: "invoice "})
+        
+        self.assertEqual(mapper.identify_provider("INVOICE 77 plain"), "Repeated")
+        self.assertEqual(mapper.identify_provider("Invoice 78 plain"), "Plain")
+        self.assertEqual(mapper.identify_provider("Receipt 77 plain"), "Plain")
+
+    def test_identify_provider_matches_pattern_loop(self):
+        """Test that the fused scan returns what trying each pattern in order would."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        patterns = [r"Acme\ Cloud", r"Cloud", r"Acme", r"(\w)\1", r"\d{4}", r"Inc\."]
+        for pattern in patterns:
+            mapper.add_mapping(pattern, pattern, source="manual")
+        texts = ["Acme Inc. 2024 Cloud", "Cloud Acme", "Inc. 12 aa", "Book 2024 Acme Cloud", "none"]
+        
+        for text in texts:
+            with self.subTest(text=text):
+                expected = next((p for p in patterns if re.search(p, text, re.IGNORECASE)), None)
+                self.assertEqual(mapper.identify_provider(text), expected)
+
+    def test_identify_provider_fuses_patterns_with_groups(self):
+        """Test that patterns with groups but no backreferences are still fused."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"(Amazon|AWS)\ Web", "AWS", source="manual")
+        mapper.add_mapping(r"(?P<name>Stripe)", "Stripe", source="manual")
+        mapper.add_mapping(r"plain", "Plain", source="manual")
+        self.assertIsNotNone(mapper._fused_pattern)
+        
+        self.assertEqual(mapper.identify_provider("plain AWS Web"), "AWS")
+        self.assertEqual(mapper.identify_provider("stripe plain"), "Stripe")
+        self.assertEqual(mapper.identify_provider("just plain"), "Plain")
+        self.assertIsNone(mapper.identify_provider("Amazon"))
+
+    def test_identify_provider_prefers_header(self):
+        """Test that a provider in the header wins and the body is searched on a miss."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Reseller", "Reseller", source="manual")
+        mapper.add_mapping(r"Acme", "Acme", source="manual")
+        body = "x" * 5000
+        
+        self.assertEqual(mapper.identify_provider(f"Acme invoice {body} Reseller"), "Acme")
+        self.assertEqual(mapper.identify_provider(f"Invoice {body} Reseller"), "Reseller")
+        self.assertIsNone(mapper.identify_provider(f"Invoice {body}"))
+
+    def test_identify_provider_ignores_matches_at_header_cut(self):
+        """Test that end anchors and lookaheads don't match where the header pass stops."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Acme$", "Acme", source="manual")
+        mapper.add_mapping(r"Initech\b", "Initech", source="manual")
+        mapper.add_mapping(r"Hooli(?!\ Labs)", "Hooli", source="manual")
+        mapper.add_mapping(r"Glob", "Globex", source="manual")
+        
+        for provider, rest in (("Acme", " more"), ("Initech", "ive"), ("Hooli", " Labs")):
+            with self.subTest(provider=provider):
+                text = "x" * (HEADER_SCAN_CHARS - len(provider)) + f"{provider}{rest} text Glob"
+                self.assertEqual(mapper.identify_provider(text), "Globex")
+        self.assertEqual(mapper.identify_provider("x" * 4092 + "Acme more text Glob"), "Globex")
+        self.assertEqual(mapper.identify_provider("x" * 5000 + " Acme"), "Acme")
+
+    def test_identify_provider_casefolds_text(self):
+        """Test that plain patterns match casefolded text and escapes keep their case."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Straße\ GmbH", "Strasse", source="manual")
+        self.assertTrue(mapper._fold_text)
+        self.assertEqual(mapper.identify_provider("STRASSE GMBH invoice"), "Strasse")
+
+        mapper.add_mapping(r"Total\S+", "Total", source="manual")
+        self.assertFalse(mapper._fold_text)
+        self.assertEqual(mapper.identify_provider("TOTALENERGIES"), "Total")
+        self.assertIsNone(mapper.identify_provider("total energies"))
+
+    def test_pattern_invalid_once_casefolded_keeps_its_case(self):
+        """Test that a pattern broken by casefolding is matched case-insensitively as written."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Acme[Z-a]Corp", "Acme", source="manual")
+        self.assertFalse(mapper._fold_text)
+        self.assertEqual(mapper.identify_provider("ACME_CORP invoice"), "Acme")
+        with open(self.mapping_file, 'r') as f:
+            self.assertEqual([m["pattern"] for m in json.load(f)["mappings"]], [r"Acme[Z-a]Corp"])
+
+    def test_identify_provider_with_hyperscan(self):
+        """Test the Hyperscan path, and its fallback to re for text that isn't valid UTF-8."""
+        class ScanTerminated(Exception):
+            pass
+        
+        class Database:
+            def compile(self, expressions, ids, elements, flags):
+                self.expressions = [re.compile(e.decode("utf-8"), re.IGNORECASE) for e in expressions]
+            
+            def scan(self, data, match_event_handler):
+                for pattern_id, expression in enumerate(self.expressions):
+                    match = expression.search(data.decode("utf-8"))
+                    if match and match_event_handler(pattern_id, match.start(), match.end(), 0, None):
+                        raise ScanTerminated()
+        
+        fake_hyperscan = MagicMock(Database=Database, ScanTerminated=ScanTerminated, error=ValueError)
+        with patch('provider_mapping.USE_HYPERSCAN', True), \
+             patch('provider_mapping.hyperscan', fake_hyperscan, create=True):
+            mapper = ProviderMapper(mapping_file=self.mapping_file)
+            mapper.add_mapping("Acme", "Acme", source="manual")
+            mapper.add_mapping("Globex", "Globex", source="manual")
+            self.assertIsNotNone(mapper._hyperscan_db)
+            
+            with patch.object(Database, 'scan', autospec=True, side_effect=Database.scan) as mock_scan:
+                self.assertEqual(mapper.identify_provider("Globex and Acme invoice"), "Acme")
+                self.assertEqual(mapper.identify_provider("Globex invoice"), "Globex")
+                self.assertEqual(mock_scan.call_count, 2)
+                
+                self.assertEqual(mapper.identify_provider("Globex \ud800 invoice"), "Globex")
+                self.assertEqual(mock_scan.call_count, 2)
+
+    def test_later_mapping_with_same_pattern_overrides(self):
+        """Test that re-adding a pattern for another provider wins, also after a reload."""
+        self.mapping_file.write_bytes(json.dumps({"version": "1.0.0", "mappings": [
+            {"pattern": "acme", "provider": "Old Acme"},
+            {"pattern": "ACME", "provider": "Acme Shouting"},
+        ]}).encode('utf-8'))
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        self.assertEqual(mapper.identify_provider("acme invoice"), "Old Acme")
+        
+        mapper.add_mapping("acme", "New Acme", source="manual")
+        self.assertEqual(mapper.identify_provider("acme invoice"), "New Acme")
+        self.assertEqual(ProviderMapper(mapping_file=self.mapping_file).identify_provider("acme invoice"), "New Acme")
+        
+        mapper.remove_mapping("ACME")
+        self.assertEqual(mapper.identify_provider("acme invoice"), "New Acme")
+
+    def test_identify_provider_caches_results(self):
+        """Test that repeated texts skip matching until the mappings change."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping("Acme", "Acme", source="manual")
+        with patch.object(mapper, '_find_provider', wraps=mapper._find_provider) as mock_find:
+            self.assertEqual(mapper.identify_provider("Acme invoice"), "Acme")
+            self.assertEqual(mapper.identify_provider("Acme invoice"), "Acme")
+            self.assertIsNone(mapper.identify_provider("Globex invoice"))
+            self.assertIsNone(mapper.identify_provider("Globex invoice"))
+            self.assertEqual(mock_find.call_count, 2)
+            
+            mapper.add_mapping("Globex", "Globex", source="manual")
+            self.assertEqual(mapper.identify_provider("Globex invoice"), "Globex")
+        self.assertEqual(mapper.hit_count, 3)
+
+    def test_mappers_share_compiled_patterns(self):
+        """Test that mappers loading the same mappings reuse the compiled regexes."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Acme\ Corp", "Acme", source="manual")
+        other = ProviderMapper(mapping_file=self.mapping_file)
+        (regex,), (other_regex,) = mapper.compiled_patterns, other.compiled_patterns
+        self.assertIs(other_regex, regex)
+        self.assertIs(other._fused_pattern, mapper._fused_pattern)
+        self.assertEqual(other.identify_provider("ACME CORP invoice"), "Acme")
+
+    def test_identify_providers_batch(self):
+        """Test that batch identification matches each text on its own."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Acme$", "Acme", source="manual")
+        mapper.add_mapping(r"Globex", "Globex", source="manual")
+        
+        texts = ["Invoice from Acme", "Globex Corp", "Acme Inc", "Glo", "bex"]
+        self.assertEqual(mapper.identify_providers_batch(texts), ["Acme", "Globex", None, None, None])
+        self.assertEqual(mapper.identify_providers_batch([]), [])
+        
+        with patch.object(mapper, '_find_provider', wraps=mapper._find_provider) as mock_find:
+            self.assertEqual(mapper.identify_providers_batch(["Globex A", "Globex A", "Globex B"]),
+                             ["Globex", "Globex", "Globex"])
+            self.assertEqual(mock_find.call_count, 2)
+
+    def test_pattern_hit_counts(self):
+        """Test that hits are counted per pattern and kept when mappings change."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping(r"Acme", "Acme", source="manual")
+        mapper.identify_provider("Acme invoice")
+        mapper.identify_provider("Acme receipt")
+        mapper.add_mapping(r"Globex", "Globex", source="manual")
+        mapper.identify_provider("Globex invoice")
+
+        self.assertEqual(mapper.get_pattern_hit_counts(), {"acme": 2, "globex": 1})
+
+    def test_deferred_save(self):
+        """Test that without autosave, changes are only written by save()."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file, autosave=False)
+        mapper.add_mapping("Acme", "Acme Corp", source="manual")
+        with open(self.mapping_file, 'r') as f:
+            self.assertEqual(json.load(f)["mappings"], [])
+        
+        mapper.save()
+        reloaded = ProviderMapper(mapping_file=self.mapping_file)
+        self.assertEqual([m["provider"] for m in reloaded.get_all_mappings()], ["Acme Corp"])
+
+    def test_batch_defers_autosave(self):
+        """Test that changes inside batch() are saved once, when the block exits."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        with patch.object(mapper, '_save_mappings_to_json', wraps=mapper._save_mappings_to_json) as mock_save:
+            with mapper.batch():
+                mapper.add_mapping("Acme", "Acme Corp", source="manual")
+                with mapper.batch():
+                    mapper.add_mapping("Globex", "Globex", source="manual")
+                mock_save.assert_not_called()
+            mock_save.assert_called_once()
+        
+        reloaded = ProviderMapper(mapping_file=self.mapping_file)
+        self.assertEqual([m["provider"] for m in reloaded.get_all_mappings()], ["Acme Corp", "Globex"])
+
+    def test_large_journal_is_compacted(self):
+        """Test that the journal is merged into the file once it outgrows it."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file, autosave=False)
+        with patch('provider_mapping.JOURNAL_COMPACT_RATIO', 1):
+            for i in range(10):
+                mapper.add_mapping(f"Vendor{i}", f"Vendor {i}", source="manual")
+        
+        # Some changes were compacted into the file, the rest are still journaled
+        with open(self.mapping_file, 'r') as f:
+            saved = len(json.load(f)["mappings"])
+        self.assertGreater(saved, 0)
+        self.assertLessEqual(mapper._journal_size, mapper._compacted_size)
+        reloaded = ProviderMapper(mapping_file=self.mapping_file, autosave=False)
+        self.assertEqual(len(reloaded.get_all_mappings()), 10)
+
+    def test_unsaved_changes_are_replayed_from_journal(self):
+        """Test that deferred changes survive a run that never called save()."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file, autosave=False)
+        mapper.add_mapping("Acme", "Acme Corp", source="manual")
+        mapper.add_mapping("Globex", "Globex", source="manual")
+        mapper.remove_mapping("Acme")
+        self.assertTrue(self.journal_file.exists())
+        
+        # A new mapper (e.g. after a crash) replays the journal, and saving merges it
+        reloaded = ProviderMapper(mapping_file=self.mapping_file, autosave=False)
+        self.assertEqual([m["provider"] for m in reloaded.get_all_mappings()], ["Globex"])
+        reloaded.save()
+        self.assertFalse(self.journal_file.exists())
+        with open(self.mapping_file, 'r') as f:
+            self.assertEqual([m["pattern"] for m in json.load(f)["mappings"]], ["Globex"])
+
+    def test_concurrent_learning_is_consistent(self):
+        """Test that threads learning mappings at once don't lose or duplicate any."""
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        providers = [f"Vendor{i}" for i in range(20)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            # Every provider is learned twice, from two different threads
+            list(executor.map(lambda p: mapper.update_from_openai_result(f"Invoice from {p}", p),
+                              providers * 2))
+        
+        self.assertEqual(sorted(m["provider"] for m in mapper.get_all_mappings()), sorted(providers))
+        self.assertEqual(len(mapper.compiled_patterns), len(providers))
+        self.assertEqual(mapper.identify_provider("Invoice from Vendor7"), "Vendor7")
+
+    def test_save_keeps_extra_mapping_fields(self):
+        """Test that fields beyond the known ones survive loading and saving."""
+        mapping = {"pattern": "openai", "provider": "OpenAI", "confidence": 0.9, "last_used": None,
+                   "source": "example", "_comment": "Example mapping", "examples": ["OpenAI LLC"]}
+        self.mapping_file.write_bytes(json.dumps({"version": "1.0.0", "mappings": [mapping]}).encode('utf-8'))
+        
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        self.assertEqual(mapper.get_all_mappings(), [mapping])
+        mapper.add_mapping("anthropic", "Anthropic", source="manual")
+        with open(self.mapping_file, 'r') as f:
+            self.assertEqual(json.load(f)["mappings"][0], mapping)
+    
+    def test_save_keeps_minimal_mapping_as_written(self):
+        """Test that a hand-written mapping keeps its keys and their order when saved."""
+        mapping = {"_comment": "c", "pattern": "acme", "provider": "Acme"}
+        self.mapping_file.write_bytes(json.dumps({"version": "1.0.0", "mappings": [mapping]}).encode('utf-8'))
+        
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping("anthropic", "Anthropic", source="manual")
+        with open(self.mapping_file, 'r') as f:
+            saved = json.load(f)["mappings"]
+        self.assertEqual(list(saved[0].items()), list(mapping.items()))
+        self.assertEqual(list(saved[1]), ["pattern", "provider", "confidence", "last_used", "source"])
+
+    def test_backup_keeps_previous_version(self):
+        """Test that each save keeps the previous file as .bak unless backups are off."""
+        backup_file = self.test_dir / "test_mappings.json.bak"
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping("Acme", "Acme Corp", source="manual")
+        mapper.add_mapping("Globex", "Globex", source="manual")
+        with open(backup_file, 'r') as f:
+            self.assertEqual([m["pattern"] for m in json.load(f)["mappings"]], ["Acme"])
+        
+        backup_file.unlink()
+        mapper = ProviderMapper(mapping_file=self.mapping_file, keep_backup=False)
+        mapper.add_mapping("Initech", "Initech", source="manual")
+        self.assertFalse(backup_file.exists())
+        self.assertEqual(len(ProviderMapper(mapping_file=self.mapping_file).get_all_mappings()), 3)
+
+    def test_restore_from_backup_reloads_previous_version(self):
+        """Test that restoring brings back the backed up mappings and keeps the backup."""
+        backup_file = self.test_dir / "test_mappings.json.bak"
+        mapper = ProviderMapper(mapping_file=self.mapping_file)
+        mapper.add_mapping("Acme", "Acme Corp", source="manual")
+        mapper.add_mapping("Globex", "Globex", source="manual")
+        
+        self.assertTrue(mapper.restore_from_backup())
+        self.assertEqual([m["pattern"] for m in mapper.get_all_mappings()], ["Acme"])
+        self.assertIsNone(mapper.identify_provider("Globex invoice"))
+        self.assertTrue(backup_file.exists())
+        
+        # Saving after a restore must leave the backup with the restored version
+        mapper.add_mapping("Initech", "Initech", source="manual")
+        with open(backup_file, 'r') as f:
+            self.assertEqual([m["pattern"] for m in json.load(f)["mappings"]], ["Acme"])
+
     def test_restore_from_backup(self):
         """Test restoring from a backup file."""
         mapper = ProviderMapper(mapping_file=self.mapping_file)
         with self.assertLogs(level='ERROR') as log:
             restored = mapper.restore_from_backup()
             self.assertFalse(restored)
-            self.assertTrue(any("Backup file not found" in msg for msg in log.output))
+            self.assertRegex("\n".join(log.output), r"Backup file not found")
 
 if __name__ == '__main__':
     unittest.main()